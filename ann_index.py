@@ -0,0 +1,245 @@
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from topk import topk_similarity, DEFAULT_MAX_BYTES
+
+# ================= 外部标签库的近似最近邻索引 (IVF) =================
+# 纯 NumPy 实现的倒排文件索引：
+#   - 构建：对外部向量做球面 k-means，得到 n_lists 个聚类中心，每个向量归入最相似的中心
+#   - 查询：先找与查询最相似的 nprobe 个中心，只在这些中心的向量里精确计算 Top-K
+# 索引保存在 external_embeddings.npy 旁边 (external_embeddings.ivf.npz)，
+# 其中记录了源向量的摘要，向量库变化后会自动重建。
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERS = 20
+KMEANS_SAMPLE_PER_LIST = 256  # 训练 k-means 时每个中心最多用多少个样本
+
+
+def index_path_for(emb_path):
+    """external_embeddings.npy -> external_embeddings.ivf.npz"""
+    return os.path.splitext(emb_path)[0] + ".ivf.npz"
+
+
+def embeddings_digest(vectors):
+    """源向量的摘要 (形状 + 内容)，用于判断索引是否过期"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(vectors.shape).encode('utf-8'))
+    h.update(vectors.tobytes())
+    return h.hexdigest()
+
+
+def default_n_lists(n_vectors):
+    """聚类中心数默认取 sqrt(N)"""
+    return max(1, int(round(np.sqrt(n_vectors))))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(vectors, n_lists, n_iter=KMEANS_ITERS, seed=0, max_bytes=DEFAULT_MAX_BYTES):
+    """按内积 (余弦) 做 k-means，返回归一化的中心 (n_lists, D)"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    n_lists = min(n_lists, n)
+
+    sample_size = min(n, n_lists * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[rng.choice(n, sample_size, replace=False)] if sample_size < n else vectors
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = topk_similarity(sample, centroids, 1, max_bytes=max_bytes, verbose=False)[0][:, 0]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=n_lists)
+
+        # 空簇重新随机挑一个样本作为中心
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = _normalize(sums)
+
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    def __init__(self, centroids, order, offsets, digest):
+        """
+        centroids : (n_lists, D) 聚类中心
+        order     : 按所属中心排好序的向量下标，第 l 个倒排表是 order[offsets[l]:offsets[l + 1]]
+        digest    : 建索引时源向量的摘要
+        """
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.digest = digest
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_iter=KMEANS_ITERS, seed=0, max_bytes=DEFAULT_MAX_BYTES):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n_lists = n_lists or default_n_lists(len(vectors))
+        print(f"🏗️  正在构建 IVF 索引: {len(vectors)} 个向量, {n_lists} 个倒排表...")
+        start_t = time.time()
+
+        centroids = spherical_kmeans(vectors, n_lists, n_iter=n_iter, seed=seed, max_bytes=max_bytes)
+        assign = topk_similarity(vectors, centroids, 1, max_bytes=max_bytes, verbose=False)[0][:, 0]
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=len(centroids)), out=offsets[1:])
+
+        print(f"✅ 索引构建完成，耗时 {time.time() - start_t:.2f}s")
+        return cls(centroids, order, offsets, embeddings_digest(vectors))
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 digest=np.array(self.digest))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["offsets"], str(data["digest"]))
+
+    def search(self, vectors, queries, k, nprobe=DEFAULT_NPROBE, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        近似 Top-K，返回值与 topk_similarity 相同：(indices, scores)，形状 (N, k)，按分数从高到低。
+        vectors 是建索引用的原始向量 (索引里不重复保存一份)。
+        探测到的向量不足 k 个的查询退回精确计算，保证每行都有 k 个有效结果。
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        n, m = len(queries), len(vectors)
+        k = min(k, m)
+        nprobe = min(nprobe, self.n_lists)
+
+        indices = np.full((n, k), -1, dtype=np.int64)
+        scores = np.full((n, k), -np.inf, dtype=np.float32)
+        if n == 0 or k == 0:
+            return indices, scores
+
+        # 1. 每个查询要探测的倒排表
+        probe = topk_similarity(queries, self.centroids, nprobe, max_bytes=max_bytes, verbose=False)[0]
+
+        # 2. 按倒排表分组：同一个表的所有查询一起做一次矩阵乘法，再与已有的 Top-K 合并
+        probe_list = probe.ravel()
+        probe_query = np.repeat(np.arange(n), nprobe)
+        by_list = np.argsort(probe_list, kind="stable")
+        bounds = np.searchsorted(probe_list[by_list], np.arange(self.n_lists + 1))
+
+        for l in range(self.n_lists):
+            q_idx = probe_query[by_list[bounds[l]:bounds[l + 1]]]
+            members = self.order[self.offsets[l]:self.offsets[l + 1]]
+            if len(q_idx) == 0 or len(members) == 0:
+                continue
+            part_idx, part_scores = topk_similarity(queries[q_idx], vectors[members], k,
+                                                    max_bytes=max_bytes, verbose=False)
+            cand_idx = np.concatenate([indices[q_idx], members[part_idx]], axis=1)
+            cand_scores = np.concatenate([scores[q_idx], part_scores], axis=1)
+            best = np.argsort(-cand_scores, axis=1, kind="stable")[:, :k]
+            indices[q_idx] = np.take_along_axis(cand_idx, best, axis=1)
+            scores[q_idx] = np.take_along_axis(cand_scores, best, axis=1)
+
+        # 3. 候选不足 k 个的查询退回精确计算
+        short = np.flatnonzero((indices < 0).any(axis=1))
+        if len(short):
+            indices[short], scores[short] = topk_similarity(queries[short], vectors, k,
+                                                            max_bytes=max_bytes, verbose=False)
+        return indices, scores
+
+
+def load_or_build_index(emb_path, vectors=None, n_lists=None, rebuild=False):
+    """
+    读取 emb_path 旁边的 IVF 索引；不存在、源向量已变化或 rebuild=True 时重新构建并保存。
+    返回 (index, vectors)
+    """
+    if vectors is None:
+        vectors = np.load(emb_path)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index_path = index_path_for(emb_path)
+
+    if not rebuild and os.path.exists(index_path):
+        index = IVFIndex.load(index_path)
+        if index.digest == embeddings_digest(vectors):
+            print(f"📂 已加载 IVF 索引: {index_path} ({index.n_lists} 个倒排表)")
+            return index, vectors
+        print("⚠️ 外部向量库已变化，索引需要重建")
+
+    index = IVFIndex.build(vectors, n_lists=n_lists)
+    index.save(index_path)
+    print(f"💾 索引已保存: {index_path}")
+    return index, vectors
+
+
+def search_topk(queries, vectors, k, mode="exact", index=None, nprobe=DEFAULT_NPROBE, max_bytes=DEFAULT_MAX_BYTES):
+    """匹配脚本的统一入口：mode="exact" 精确分块 Top-K，mode="ann" 走 IVF 索引"""
+    if mode == "ann":
+        if index is None:
+            raise ValueError("mode='ann' 需要传入 IVF 索引")
+        start_t = time.time()
+        result = index.search(vectors, queries, k, nprobe=nprobe, max_bytes=max_bytes)
+        print(f"🧭 IVF 近似 Top-{k}: {len(queries)} 个查询, nprobe={nprobe}, 耗时 {time.time() - start_t:.2f}s")
+        return result
+    if mode != "exact":
+        raise ValueError(f"未知的匹配模式: {mode}")
+    return topk_similarity(queries, vectors, k, max_bytes=max_bytes)
+
+
+def recall_report(index, vectors, queries, k, nprobes=(1, 2, 4, 8, 16, 32), max_bytes=DEFAULT_MAX_BYTES):
+    """
+    以精确 Top-K 为基准，打印不同 nprobe 下的召回率 (recall@k) 和耗时。
+    返回 [{"nprobe", "recall", "seconds"}, ...]，第一行 nprobe=None 表示精确计算。
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    start_t = time.time()
+    exact_idx, _ = topk_similarity(queries, vectors, k, max_bytes=max_bytes, verbose=False)
+    exact_seconds = time.time() - start_t
+    k = exact_idx.shape[1]
+
+    rows = [{"nprobe": None, "recall": 1.0, "seconds": exact_seconds}]
+    print(f"\n📊 召回率 / 耗时 ({len(queries)} 个查询, {len(vectors)} 个向量, {index.n_lists} 个倒排表, Top-{k})")
+    print(f"   {'模式':<12}{'recall@' + str(k):>10}{'耗时(s)':>10}{'加速比':>8}")
+    print(f"   {'精确':<12}{1.0:>10.4f}{exact_seconds:>10.3f}{1.0:>8.1f}")
+
+    for nprobe in nprobes:
+        if nprobe > index.n_lists:
+            break
+        start_t = time.time()
+        ann_idx, _ = index.search(vectors, queries, k, nprobe=nprobe, max_bytes=max_bytes)
+        seconds = time.time() - start_t
+        hits = sum(len(np.intersect1d(a, e)) for a, e in zip(ann_idx, exact_idx))
+        recall = hits / max(1, exact_idx.size)
+        rows.append({"nprobe": nprobe, "recall": recall, "seconds": seconds})
+        print(f"   {'nprobe=' + str(nprobe):<12}{recall:>10.4f}{seconds:>10.3f}{exact_seconds / max(seconds, 1e-9):>8.1f}")
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为外部标签向量库构建 IVF 索引，并输出召回率/耗时报告")
+    parser.add_argument("embeddings", help="外部向量文件，例如 D:\\predict\\0.1\\embeddings_output\\external_embeddings.npy")
+    parser.add_argument("--queries", help="用于评估的查询向量 (.npy)，默认从外部向量中抽样")
+    parser.add_argument("--n-lists", type=int, default=None, help="倒排表个数，默认 sqrt(N)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--sample", type=int, default=2000, help="评估时最多使用的查询个数")
+    parser.add_argument("--rebuild", action="store_true", help="忽略已有索引，强制重建")
+    args = parser.parse_args()
+
+    index, vectors = load_or_build_index(args.embeddings, n_lists=args.n_lists, rebuild=args.rebuild)
+
+    rng = np.random.default_rng(0)
+    queries = np.load(args.queries) if args.queries else vectors
+    if len(queries) > args.sample:
+        queries = queries[rng.choice(len(queries), args.sample, replace=False)]
+    recall_report(index, vectors, queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,449 @@
+import argparse
+import ast
+import contextlib
+import hashlib
+import importlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from tree_io import flat_projects_path
+from raw_reader import project_data_path
+
+# ================= 统一的多年份流水线入口 =================
+# 用法:
+#   python atas.py run --years 2014-2025 --stages 2-8 --config atas_config.json
+#
+# - 配置文件里的路径可以带 {year}，每个年份各自展开
+# - 各阶段按依赖关系 (DAG) 调度：2 -> 4 -> 5 -> 6 -> 7/8，3 (内外标签映射) 与年份无关，只运行一次，6/8 依赖它
+# - 每个任务的 "签名" = 输入文件内容哈希 + 脚本及其导入的本仓库模块的源码哈希 + 参数；签名未变且输出文件没有被改动时直接跳过
+# - 互不依赖的任务 (例如不同年份) 在多个进程中并行运行；每个阶段可以单独限制并发数
+# - 每个任务的输出写到 log_dir 下单独的日志文件，状态保存在 state_file 中
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(HERE, "atas_config.json")
+RUNNER_MODULE = os.path.splitext(os.path.basename(__file__))[0]
+DEFAULT_WORKERS = 3
+# step4 使用 GPU 和共享的 SQLite 向量缓存，默认同一时间只运行一个年份
+DEFAULT_STAGE_CONCURRENCY = {4: 1}
+
+# 任务状态
+DONE, SKIPPED, PENDING, FAILED, UPSTREAM_FAILED = "完成", "跳过", "待运行", "失败", "上游失败"
+
+
+def _labels_file(path):
+    """外部标签文件可以省略 .txt 后缀 (与 step4/step5 的处理一致)"""
+    return path if os.path.exists(path) or not os.path.exists(path + ".txt") else path + ".txt"
+
+
+def _graph_outputs(path):
+    """step8 二进制图谱的节点表和边表 (graph_store 会导入 pandas，只在配置了导出路径时才导入)"""
+    if not path:
+        return []
+    from graph_store import graph_paths
+    return list(graph_paths(path))
+
+
+def _intermediate_path(path):
+    """列式中间文件的路径 (frame_store 会导入 pandas，用到时再导入)"""
+    from frame_store import intermediate_path
+    return intermediate_path(path)
+
+
+def _mapping_inputs(path):
+    """
+    step6/step8 通过 mapping_index.read_mapping_table 读取映射表：优先列式中间文件，其次 xlsx，最后同名 CSV。
+    三个文件都算输入 (不存在的也算，之后出现时签名会变化)
+    """
+    from mapping_index import source_candidates
+    return source_candidates(path)
+
+
+class OptionalOutput(str):
+    """可以不存在的输出文件 (例如缺少 openpyxl 时 write_frame 不导出 xlsx)；存在时同样记录哈希"""
+
+
+# 每个阶段: 模块、入口函数、是否按年份运行、依赖的阶段、
+# plan(paths, config) -> (输入文件列表, 输出文件列表, 调用参数)
+STAGES = {
+    2: {
+        "name": "原始 CSV -> 技术树 JSON",
+        "module": "step2_transcsvtojson", "func": "process_large_csv", "per_year": True, "deps": [],
+        "plan": lambda p, c: (
+            [p["raw_csv"]],
+            [p["tree_json"], flat_projects_path(p["tree_json"]), project_data_path(p["raw_csv"])],
+            {"input_path": p["raw_csv"], "output_path": p["tree_json"], "flat_projects": True,
+             "project_data": True, "workers": c.get("step2_parse_workers", 1)},
+        ),
+    },
+    3: {
+        "name": "内部标签 -> 外部标签映射表",
+        "module": "step3_match", "func": "main", "per_year": False, "deps": [],
+        "plan": lambda p, c: (
+            [os.path.join(p["embeddings_dir"], name) for name in (
+                "internal_embeddings.npy", "external_embeddings.npy",
+                "internal_labels_clean.txt", "external_labels_clean.txt")],
+            # 下游读取的是列式中间文件，xlsx 只是给人看的导出结果
+            [_intermediate_path(p["label_mapping"]), OptionalOutput(p["label_mapping"])],
+            {"data_dir": p["embeddings_dir"], "output_excel": p["label_mapping"]},
+        ),
+    },
+    4: {
+        "name": "项目向量 + 外部标签匹配",
+        "module": "step4_GPU", "func": "main", "per_year": True, "deps": [2],
+        "plan": lambda p, c: (
+            [p["tree_json"], flat_projects_path(p["tree_json"]), _labels_file(p["external_labels"])],
+            [p["project_labels_csv"], p["project_embeddings"]],
+            {"json_file_path": p["tree_json"], "external_txt_path": p["external_labels"],
+             "local_model_path": p["model"], "output_excel": p["project_labels_excel"],
+             "output_csv": p["project_labels_csv"], "emb_store_path": p["embedding_store"],
+             "label_cache_dir": p["label_cache_dir"], "cache_emb_path": p["project_embeddings"]},
+        ),
+    },
+    5: {
+        "name": "按缓存向量生成修复版结果",
+        "module": "step5", "func": "main", "per_year": True, "deps": [4],
+        "plan": lambda p, c: (
+            [p["tree_json"], flat_projects_path(p["tree_json"]), p["project_embeddings"],
+             _labels_file(p["external_labels"])],
+            [p["project_fixed_csv"]],
+            {"json_file_path": p["tree_json"], "external_txt_path": p["external_labels"],
+             "local_model_path": p["model"], "cache_emb_path": p["project_embeddings"],
+             "label_cache_dir": p["label_cache_dir"], "output_csv_fixed": p["project_fixed_csv"]},
+        ),
+    },
+    6: {
+        "name": "全路径反查报表",
+        "module": "step6", "func": "main", "per_year": True, "deps": [5, 3],
+        "plan": lambda p, c: (
+            [p["project_fixed_csv"], *_mapping_inputs(p["label_mapping"])],
+            [p["flattened_report"]],
+            {"project_csv": p["project_fixed_csv"], "mapping_file": p["label_mapping"],
+             "output_flat_csv": p["flattened_report"]},
+        ),
+    },
+    7: {
+        "name": "内部标签共现统计",
+        "module": "step7_统计原标签共现", "func": "main", "per_year": True, "deps": [6],
+        "plan": lambda p, c: (
+            [p["flattened_report"]],
+            [path for path in (p["internal_cooc"], p.get("internal_cooc_counts")) if path],
+            {"input_csv": p["flattened_report"], "output_csv": p["internal_cooc"],
+             # step7_count_workers > 1 为实验性的分片计数，尚未测到加速，默认保持 1
+             "cooc_path": p.get("internal_cooc_counts"), "workers": c.get("step7_count_workers", 1)},
+        ),
+    },
+    8: {
+        "name": "外部技术加权共现图谱",
+        "module": "step8_统计外部共现（内外加权）", "func": "main", "per_year": True, "deps": [6, 3],
+        "plan": lambda p, c: (
+            [p["flattened_report"], *_mapping_inputs(p["label_mapping"])],
+            [p["external_graph"], *_graph_outputs(p.get("external_graph_binary"))],
+            {"project_csv": p["flattened_report"], "mapping_file": p["label_mapping"],
+             "output_csv": p["external_graph"], "graph_path": p.get("external_graph_binary"),
+             "graph_top_n": c.get("step8_graph_top_n")},
+        ),
+    },
+}
+
+
+# ================= 配置与参数解析 =================
+
+def parse_range_list(text):
+    """'2014-2016,2020' -> [2014, 2015, 2016, 2020]"""
+    values = []
+    for part in str(text).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = (int(x) for x in part.split("-", 1))
+            values.extend(range(lo, hi + 1))
+        else:
+            values.append(int(part))
+    return sorted(set(values))
+
+
+def load_config(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if "paths" not in config:
+        raise ValueError(f"配置文件缺少 paths: {path}")
+    return config
+
+
+def expand_paths(config, year):
+    """把配置里的 {year} 换成具体年份；与年份无关的任务 year=None，此时路径不能带 {year}"""
+    paths = {}
+    for key, value in config["paths"].items():
+        if "{year}" in value:
+            paths[key] = None if year is None else value.format(year=year)
+        else:
+            paths[key] = value
+    return paths
+
+
+def task_name(task):
+    stage, year = task
+    return f"step{stage}" if year is None else f"step{stage}[{year}]"
+
+
+# ================= 内容哈希与状态文件 =================
+
+def _imported_names(path):
+    """源码中 import / from ... import / importlib.import_module("...") 引用的顶层模块名 (包括函数内部的延迟导入)"""
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name.split(".")[0]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            yield node.module.split(".")[0]
+        elif (isinstance(node, ast.Call) and getattr(node.func, "attr", None) == "import_module"
+              and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+            yield node.args[0].value.split(".")[0]
+
+
+def local_modules(module, _cache={}):
+    """阶段脚本以及它直接或间接导入的本仓库模块 (HERE 下的 .py)，按名称排序"""
+    if module not in _cache:
+        seen = set()
+        todo = [module]
+        while todo:
+            name = todo.pop()
+            path = os.path.join(HERE, name + ".py")
+            # 流水线入口本身不算 (cooc_store 的命令行只借用它的年份解析)
+            if name in seen or name == RUNNER_MODULE or not os.path.exists(path):
+                continue
+            seen.add(name)
+            todo.extend(_imported_names(path))
+        _cache[module] = sorted(seen)
+    return _cache[module]
+
+
+class StateStore:
+    """
+    state_file 中保存:
+      digests : { 路径: [大小, 修改时间, 内容哈希] }，大小和修改时间都没变时不重新读文件
+      tasks   : { 任务名: { signature, outputs: { 路径: 内容哈希 }, seconds, finished_at } }
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {"digests": {}, "tasks": {}}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    def digest(self, path):
+        if not path or not os.path.exists(path):
+            return "missing"
+        st = os.stat(path)
+        cached = self.data["digests"].get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(4 * 1024 * 1024), b''):
+                h.update(chunk)
+        value = h.hexdigest()
+        self.data["digests"][path] = [st.st_size, st.st_mtime_ns, value]
+        return value
+
+    def signature(self, module, inputs, kwargs):
+        """输入内容 + 脚本及其依赖模块的源码 + 调用参数 的哈希"""
+        h = hashlib.blake2b(digest_size=16)
+        for name in local_modules(module):
+            h.update(f"{name}\0{self.digest(os.path.join(HERE, name + '.py'))}\0".encode('utf-8'))
+        for path in inputs:
+            h.update(f"{path}\0{self.digest(path)}\0".encode('utf-8'))
+        h.update(json.dumps(kwargs, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        return h.hexdigest()
+
+    def is_up_to_date(self, name, signature, outputs):
+        record = self.data["tasks"].get(name)
+        if not record or record["signature"] != signature:
+            return False
+        # 输出文件被删除或被手工改动过也要重新运行 (可选的输出只要求与记录时一致)
+        return all(record["outputs"].get(path) == self.digest(path)
+                   and (isinstance(path, OptionalOutput) or self.digest(path) != "missing") for path in outputs)
+
+    def record(self, name, signature, outputs, seconds):
+        self.data["tasks"][name] = {
+            "signature": signature,
+            "outputs": {path: self.digest(path) for path in outputs},
+            "seconds": round(seconds, 2),
+            "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def save(self):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# ================= 任务执行 (子进程) =================
+
+def run_task(module_name, func_name, kwargs, log_path):
+    """在子进程中导入阶段脚本并调用入口函数，输出写入日志文件"""
+    start_t = time.time()
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    with open(log_path, 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            # step7/step8 的文件名含中文，只能通过 importlib 按名称导入
+            func = getattr(importlib.import_module(module_name), func_name)
+            result = func(**kwargs)
+        except BaseException as e:
+            # 脚本里有 exit()，这里统一转成普通异常交给调度器
+            traceback.print_exc()
+            raise RuntimeError(f"{module_name}.{func_name} 失败: {e!r}，详见 {log_path}") from None
+    return result, time.time() - start_t
+
+
+# ================= 调度 =================
+
+def build_tasks(stages, years):
+    """返回 { (阶段, 年份或 None): [依赖任务, ...] }；未选中的阶段不作为依赖 (视为输出已存在)"""
+    tasks = {}
+    for stage in stages:
+        spec = STAGES[stage]
+        for year in (years if spec["per_year"] else [None]):
+            deps = []
+            for dep in spec["deps"]:
+                if dep in stages:
+                    deps.append((dep, year if STAGES[dep]["per_year"] else None))
+            tasks[(stage, year)] = deps
+    return tasks
+
+
+def run_pipeline(config, years, stages, workers=None, force=False, dry_run=False):
+    """按依赖关系调度所有任务，返回 { 任务名: 状态 }"""
+    workers = workers or config.get("workers", DEFAULT_WORKERS)
+    limits = dict(DEFAULT_STAGE_CONCURRENCY)
+    limits.update({int(k): v for k, v in config.get("stage_concurrency", {}).items()})
+    # 并发数小于 1 的阶段永远无法提交任务，调度循环会一直空转
+    invalid = {stage: n for stage, n in [("workers", workers), *limits.items()]
+               if not isinstance(n, int) or isinstance(n, bool) or n < 1}
+    if invalid:
+        raise ValueError(f"workers / stage_concurrency 必须是不小于 1 的整数: {invalid}")
+    state = StateStore(config.get("state_file", os.path.join(HERE, "atas_state.json")))
+    log_dir = config.get("log_dir", os.path.join(os.path.dirname(os.path.abspath(state.path)), "atas_logs"))
+
+    tasks = build_tasks(stages, years)
+    status = {}
+    running = {}  # future -> (task, signature, outputs)
+    print(f"🗂️  共 {len(tasks)} 个任务 ({len(years)} 个年份 × 阶段 {stages})，最多 {workers} 个并行")
+
+    def ready_tasks():
+        for task, deps in tasks.items():
+            if task in status or any(t == task for t, _, _ in running.values()):
+                continue
+            if any(status.get(d) in (FAILED, UPSTREAM_FAILED) for d in deps):
+                status[task] = UPSTREAM_FAILED
+                print(f"⛔ {task_name(task)}: 依赖的任务失败，不运行")
+                continue
+            if all(status.get(d) in (DONE, SKIPPED, PENDING) for d in deps):
+                yield task
+
+    def stage_running(stage):
+        return sum(1 for t, _, _ in running.values() if t[0] == stage)
+
+    start_t = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while len(status) < len(tasks):
+            for task in list(ready_tasks()):
+                stage, year = task
+                if len(running) >= workers or stage_running(stage) >= limits.get(stage, workers):
+                    continue
+                spec = STAGES[stage]
+                paths = expand_paths(config, year)
+                inputs, outputs, kwargs = spec["plan"](paths, config)
+                name = task_name(task)
+
+                if dry_run and any(status[d] == PENDING for d in tasks[task]):
+                    # 上游需要重新运行，输入必然会变化
+                    status[task] = PENDING
+                    print(f"📝 {name}: 需要运行 ({spec['name']}，上游有变化)")
+                    continue
+                signature = state.signature(spec["module"], inputs, kwargs)
+                if not force and state.is_up_to_date(name, signature, outputs):
+                    status[task] = SKIPPED
+                    print(f"⏭️  {name}: 输入未变化，跳过")
+                    continue
+                if dry_run:
+                    status[task] = PENDING
+                    print(f"📝 {name}: 需要运行 ({spec['name']})")
+                    continue
+
+                log_path = os.path.join(log_dir, f"{name}.log".replace("[", "_").replace("]", ""))
+                print(f"▶️  {name}: {spec['name']} (日志: {log_path})")
+                future = pool.submit(run_task, spec["module"], spec["func"], kwargs, log_path)
+                running[future] = (task, signature, outputs)
+
+            if not running:
+                if len(status) < len(tasks) and not list(ready_tasks()):
+                    break  # 没有可运行的任务 (不应出现，依赖关系无环)
+                continue
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                task, signature, outputs = running.pop(future)
+                name = task_name(task)
+                try:
+                    result, seconds = future.result()
+                    if task[0] == 2 and result is None:
+                        raise RuntimeError("process_large_csv 返回失败")
+                    missing = [p for p in outputs if not isinstance(p, OptionalOutput) and not os.path.exists(p)]
+                    if missing:
+                        raise RuntimeError(f"运行结束但缺少输出文件: {missing}")
+                except Exception as e:
+                    status[task] = FAILED
+                    print(f"❌ {name}: {e}")
+                    continue
+                status[task] = DONE
+                state.record(name, signature, outputs, seconds)
+                state.save()
+                print(f"✅ {name}: 完成，耗时 {seconds:.1f}s")
+
+    state.save()
+    counts = {}
+    for value in status.values():
+        counts[value] = counts.get(value, 0) + 1
+    summary = ", ".join(f"{k} {v}" for k, v in counts.items())
+    print(f"\n🏁 流水线结束，总耗时 {time.time() - start_t:.1f}s: {summary}")
+    return {task_name(t): s for t, s in status.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="atas", description="ATAS 多年份流水线")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="按依赖关系运行指定年份和阶段")
+    run.add_argument("--years", required=True, help="例如 2014-2025 或 2015,2021")
+    run.add_argument("--stages", default="2-8", help=f"例如 2-8 或 4,5 (可选: {sorted(STAGES)})")
+    run.add_argument("--config", default=DEFAULT_CONFIG, help="JSON 配置文件")
+    run.add_argument("--workers", type=int, default=None, help="并行进程数 (默认取配置里的 workers)")
+    run.add_argument("--force", action="store_true", help="忽略已有状态，全部重新运行")
+    run.add_argument("--dry-run", action="store_true", help="只列出需要运行的任务")
+    args = parser.parse_args()
+
+    stages = parse_range_list(args.stages)
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"未知的阶段: {unknown}")
+    config = load_config(args.config)
+    status = run_pipeline(config, parse_range_list(args.years), stages, workers=args.workers,
+                          force=args.force, dry_run=args.dry_run)
+    if any(s in (FAILED, UPSTREAM_FAILED) for s in status.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
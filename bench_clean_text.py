@@ -0,0 +1,69 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from step5 import clean_text, clean_text_column
+
+# ================= step5 文本清洗基准 =================
+# 对比逐行 series.map(clean_text) 与整列 clean_text_column 的耗时，并核对结果一致。
+# 模拟两种列：项目名称 (几乎都不重复) 和 原内部路径 (重复度高)，
+# 分别用 object 列和 Arrow 字符串列 (pandas 3 读 CSV/Parquet 的默认类型) 各测一遍。
+
+DEFAULT_ROWS = 1000000
+DEFAULT_DIRTY_RATIO = 0.01  # 含换行/制表符/控制字符或首尾空白的行占比
+
+
+def make_columns(n_rows, dirty_ratio, seed=0):
+    """返回 { 列名: 值列表 }"""
+    rng = np.random.default_rng(seed)
+    n_paths = max(10, n_rows // 200)
+    dirty = rng.random(n_rows) < dirty_ratio
+    names = [f" 关于某某技术的研究\n与应用\t项目{i}\x07 " if d else f"关于某某技术的研究与应用项目{i}"
+             for i, d in enumerate(dirty)]
+    paths = [f"root > 领域{i % 12} > 方向{i % 97}\r\n > 业务{i}" if i % 50 == 0 else f"root > 领域{i % 12} > 方向{i % 97} > 业务{i}"
+             for i in range(n_paths)]
+    path_col = [paths[i] for i in rng.integers(0, n_paths, n_rows)]
+    return {"项目名称": names, "原内部路径": path_col}
+
+
+def _time(func):
+    start_t = time.time()
+    result = func()
+    return time.time() - start_t, result
+
+
+def bench_column(label, series):
+    loop_s, expected = _time(lambda: series.map(clean_text))
+    column_s, result = _time(lambda: clean_text_column(series))
+    same = expected.astype(object).equals(result.astype(object))
+    speedup = loop_s / column_s if column_s > 0 else float("inf")
+    print(f"   {label:<24}{loop_s:>10.3f}{column_s:>10.3f}{speedup:>8.1f}x  {'✅' if same else '❌ 结果不一致'}")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较 step5 逐行 clean_text 与整列 clean_text_column 的耗时")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="模拟数据的行数")
+    parser.add_argument("--dirty-ratio", type=float, default=DEFAULT_DIRTY_RATIO, help="需要清洗的项目名称占比")
+    args = parser.parse_args()
+
+    columns = make_columns(args.rows, args.dirty_ratio)
+    print("=" * 50)
+    print(f"⏱️  文本清洗: {args.rows} 行")
+    print("=" * 50)
+    print(f"   {'列':<24}{'逐行(s)':>10}{'整列(s)':>10}{'加速':>9}")
+    all_same = True
+    for dtype, dtype_label in ((object, "object"), ("string[pyarrow]", "Arrow")):
+        try:
+            for col, values in columns.items():
+                all_same &= bench_column(f"{col} ({dtype_label})", pd.Series(values, dtype=dtype))
+        except (ImportError, TypeError) as e:
+            print(f"   ⚠️ 跳过 {dtype_label} 字符串列: {e}")
+    if not all_same:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
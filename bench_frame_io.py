@@ -0,0 +1,110 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from frame_store import read_frame, to_columnar
+
+# ================= 阶段中间文件读写基准 =================
+# 对每个阶段的交接表，分别测量 CSV (utf-8-sig) / xlsx / Parquet / Feather 的写入、读取耗时和文件大小。
+# 默认用模拟数据 (行数、重复度与真实数据相近)；也可以传入真实的 CSV/xlsx 文件路径。
+
+DEFAULT_ROWS = 200000
+EXCEL_MAX_ROWS = 50000  # openpyxl 太慢，超过这个行数的表只测前这么多行的 xlsx
+
+
+def make_stage_frames(n_rows, seed=0):
+    """按各阶段的列结构生成模拟数据: { 阶段名: DataFrame }"""
+    rng = np.random.default_rng(seed)
+    n_paths = max(10, n_rows // 200)
+    n_ext = max(10, n_rows // 100)
+    paths = np.array([f"root > 领域{i % 12} > 方向{i % 97} > 业务{i}" for i in range(n_paths)], dtype=object)
+    ext = np.array([f"通用领域-方向{i % 53}-技术{i}" for i in range(n_ext)], dtype=object)
+    names = np.array([f"关于某某技术的研究与应用项目{i}" for i in range(n_rows)], dtype=object)
+
+    step5 = pd.DataFrame({"项目名称": names, "原内部路径": paths[rng.integers(0, n_paths, n_rows)]})
+    for rank in range(1, 4):
+        step5[f"外部标签_{rank}"] = ext[rng.integers(0, n_ext, n_rows)]
+        step5[f"相似度_{rank}"] = np.round(rng.uniform(0.3, 0.9, n_rows), 4)
+
+    leaf_paths = np.array([p.replace("root > ", "") for p in paths], dtype=object)
+    step6 = pd.DataFrame({"项目名称": names, "原内部归属(完整)": leaf_paths[rng.integers(0, n_paths, n_rows)]})
+    for rank in range(1, 4):
+        step6[f"AI匹配技术_{rank}"] = ext[rng.integers(0, n_ext, n_rows)]
+    for rank in range(1, 4):
+        step6[f"反查归属_{rank}(完整)"] = leaf_paths[rng.integers(0, n_paths, n_rows)]
+
+    mapping = pd.DataFrame({"内部标签": leaf_paths})
+    for rank in range(1, 4):
+        mapping[f"匹配外部标签_{rank}"] = ext[rng.integers(0, n_ext, n_paths)]
+        mapping[f"相似度_{rank}"] = np.round(rng.uniform(0.3, 0.9, n_paths), 4)
+
+    return {"step5 修复结果": step5, "step6 全路径报表": step6, "step3 映射表": mapping}
+
+
+def _time(func):
+    start_t = time.time()
+    func()
+    return time.time() - start_t
+
+
+def bench_frame(label, df, folder):
+    """返回 [(格式, 写入秒, 读取秒, 文件MB), ...] 并打印"""
+    rows = []
+    base = os.path.join(folder, "bench")
+    columnar = to_columnar(df)
+
+    csv_path = base + ".csv"
+    rows.append(("csv", _time(lambda: df.to_csv(csv_path, index=False, encoding='utf-8-sig')),
+                 _time(lambda: pd.read_csv(csv_path, encoding='utf-8-sig')), os.path.getsize(csv_path)))
+
+    try:
+        import openpyxl  # noqa: F401
+        xlsx_df = df.head(EXCEL_MAX_ROWS)
+        xlsx_path = base + ".xlsx"
+        rows.append((f"xlsx ({len(xlsx_df)} 行)", _time(lambda: xlsx_df.to_excel(xlsx_path, index=False)),
+                     _time(lambda: pd.read_excel(xlsx_path)), os.path.getsize(xlsx_path)))
+    except ImportError:
+        print("   ⚠️ 缺少 openpyxl，跳过 xlsx")
+
+    try:
+        parquet_path = base + ".parquet"
+        rows.append(("parquet", _time(lambda: columnar.to_parquet(parquet_path, index=False)),
+                     _time(lambda: pd.read_parquet(parquet_path)), os.path.getsize(parquet_path)))
+        feather_path = base + ".feather"
+        rows.append(("feather", _time(lambda: columnar.reset_index(drop=True).to_feather(feather_path)),
+                     _time(lambda: pd.read_feather(feather_path)), os.path.getsize(feather_path)))
+    except ImportError:
+        print("   ⚠️ 缺少 pyarrow，跳过 parquet / feather")
+
+    print(f"\n📊 {label}: {len(df)} 行 × {df.shape[1]} 列")
+    print(f"   {'格式':<18}{'写入(s)':>10}{'读取(s)':>10}{'大小(MB)':>10}")
+    for fmt, write_s, read_s, size in rows:
+        print(f"   {fmt:<18}{write_s:>10.3f}{read_s:>10.3f}{size / 1024 ** 2:>10.2f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较各阶段中间表在 CSV / xlsx / Parquet / Feather 下的读写耗时")
+    parser.add_argument("files", nargs="*", help="真实的阶段输出 (CSV/xlsx)；不传则使用模拟数据")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="模拟数据的行数")
+    args = parser.parse_args()
+
+    if args.files:
+        frames = {os.path.basename(path): read_frame(path) for path in args.files}
+    else:
+        frames = make_stage_frames(args.rows)
+
+    print("=" * 50)
+    print("⏱️  阶段中间文件读写基准")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as folder:
+        for label, df in frames.items():
+            bench_frame(label, df, folder)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
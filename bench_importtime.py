@@ -0,0 +1,96 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# ================= 启动耗时基准 (python -X importtime) =================
+# 在全新的子进程里 import 各个脚本 (只导入、不运行 main)，解析 -X importtime 的输出：
+#   - 导入总耗时、墙钟时间
+#   - 是否导入了 torch / sentence_transformers
+#   - 被直接导入的模块中累计耗时最多的几个 (例如 pandas / torch)
+# 对比的基准是 "import torch, sentence_transformers"，即原来每个脚本顶部都要付出的开销。
+
+DEFAULT_MODULES = ["step4_GPU", "step4gpu2", "step5", "step4_project_match"]
+EAGER_BASELINE = "torch, sentence_transformers"
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers")
+
+
+def parse_importtime(stderr):
+    """
+    解析 "import time: self [us] | cumulative | imported package" 行，
+    返回 [(模块名, 自身耗时us, 累计耗时us, 缩进层级), ...]
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        records.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return records
+
+
+def measure(import_stmt, cwd):
+    """在新进程中执行 import_stmt，返回统计信息"""
+    start_t = time.time()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", import_stmt],
+                          cwd=cwd, capture_output=True, text=True)
+    wall = time.time() - start_t
+    records = parse_importtime(proc.stderr)
+
+    # 顶层 (缩进最少) 的记录的累计耗时之和即总导入耗时
+    min_depth = min((r[3] for r in records), default=0)
+    top = [r for r in records if r[3] == min_depth]
+    direct = [r for r in records if r[3] == min_depth + 1]
+    names = {r[0] for r in records}
+    return {
+        "stmt": import_stmt,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else "",
+        "wall_seconds": wall,
+        "import_seconds": sum(r[2] for r in top) / 1e6,
+        "heavy": sorted(m for m in HEAVY_MODULES if m in names),
+        "top": sorted(direct, key=lambda r: r[2], reverse=True),
+    }
+
+
+def print_result(label, result, top_n):
+    if not result["ok"]:
+        print(f"❌ {label}: 导入失败 ({result['error']})")
+        return
+    heavy = ", ".join(result["heavy"]) if result["heavy"] else "无"
+    print(f"📦 {label}: 导入 {result['import_seconds']:.3f}s, 进程总耗时 {result['wall_seconds']:.3f}s, 重型依赖: {heavy}")
+    for name, _, cumulative_us, _ in result["top"][:top_n]:
+        print(f"     {cumulative_us / 1e3:>9.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比各脚本的冷启动导入耗时 (python -X importtime)")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="要测量的模块名")
+    parser.add_argument("--top", type=int, default=8, help="每个模块显示累计耗时最多的前几个直接导入")
+    parser.add_argument("--no-baseline", action="store_true", help=f"不测量 import {EAGER_BASELINE}")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    print("=" * 50)
+    print("⏱️  冷启动导入耗时")
+    print("=" * 50)
+
+    baseline = None
+    if not args.no_baseline:
+        baseline = measure(f"import {EAGER_BASELINE}", cwd)
+        print_result(f"基准 import {EAGER_BASELINE}", baseline, args.top)
+
+    for module in args.modules:
+        result = measure(f"import {module}", cwd)
+        print_result(module, result, args.top)
+        if result["ok"] and baseline and baseline["ok"] and not result["heavy"]:
+            print(f"     ✅ 未导入重型依赖，比顶部直接导入至少节省 {baseline['import_seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from raw_reader import iter_lines, parse_source_line
+from step2_transcsvtojson import parse_line, add_project, new_node
+
+# ================= 单个大文件的切块并行解析 =================
+# 把原始 ### 分隔文件按字节切成若干区间 (区间边界对齐到换行符之后)，
+# 每个子进程只内存映射读取自己的区间，用与串行路径完全相同的解析函数处理，
+# 主进程再按区间顺序合并局部结果，所以输出与逐行串行解析一致。
+# 同一次扫描可以同时构建分类树 (step2) 和金额/时间字典 (datacollection)。
+
+# 每块的目标大小；块数多于进程数可以限制单个子进程的内存占用
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def split_byte_ranges(path, chunk_bytes=CHUNK_BYTES):
+    """返回 [(start, end), ...]，每个区间都以换行符结尾 (最后一块除外)"""
+    file_size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < file_size:
+            end = start + chunk_bytes
+            if end >= file_size:
+                end = file_size
+            else:
+                f.seek(end)
+                f.readline()  # 前进到下一个换行符之后
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_range(args):
+    """子进程：解析一个字节区间，返回 (局部树, 有效行数, 局部字典, 脏行数)"""
+    path, start, end, build_tree, build_project_map = args
+    root = new_node() if build_tree else None
+    line_count = 0
+    project_data_map = {} if build_project_map else None
+    dirty_lines_count = 0
+
+    for line in iter_lines(path, start, end):
+        if build_project_map:
+            record = parse_source_line(line)
+            if record is None:
+                dirty_lines_count += 1
+            else:
+                project_data_map[record[0]] = record[1:]
+
+        if build_tree:
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            project_name, categories = parsed
+            add_project(root, categories, project_name)
+            line_count += 1
+
+    return root, line_count, project_data_map, dirty_lines_count
+
+
+def merge_tree(into, other):
+    """
+    把后一块的局部树并入前一块：已有节点递归合并、新节点追加在后、项目列表按顺序拼接。
+    按区间顺序合并时，子节点顺序和项目顺序都与串行构建相同。
+    """
+    into_children = into["children"]
+    for name, child in other["children"].items():
+        mine = into_children.get(name)
+        if mine is None:
+            into_children[name] = child
+        else:
+            merge_tree(mine, child)
+
+    if other["projects"] is not None:
+        if into["projects"] is None:
+            into["projects"] = other["projects"]
+        else:
+            into["projects"].extend(other["projects"])
+
+
+def scan_raw_file(path, workers, build_tree=True, build_project_map=True, chunk_bytes=CHUNK_BYTES):
+    """
+    切块并行扫描一次原始文件，按需同时构建分类树和金额/时间字典。
+    返回 {"root", "rows", "project_data_map", "dirty_lines"} (未构建的部分为 None / 0)
+    """
+    ranges = split_byte_ranges(path, chunk_bytes)
+    print(f"切分为 {len(ranges)} 块，使用 {workers} 个进程并行解析...")
+    start_time = time.time()
+
+    root = new_node() if build_tree else None
+    line_count = 0
+    project_data_map = {} if build_project_map else None
+    dirty_lines_count = 0
+
+    tasks = [(path, s, e, build_tree, build_project_map) for s, e in ranges]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map 按提交顺序返回，保证合并顺序确定
+        for i, (part_root, count, part_map, dirty) in enumerate(pool.map(_parse_range, tasks)):
+            if build_tree:
+                merge_tree(root, part_root)
+                line_count += count
+            if build_project_map:
+                # 按块顺序 update：重复项目保留首次出现的位置、取最后一次出现的值，与串行逐行覆盖一致
+                project_data_map.update(part_map)
+                dirty_lines_count += dirty
+            print(f"已合并 {i + 1}/{len(ranges)} 块... (耗时: {time.time() - start_time:.2f}s)")
+
+    return {
+        "root": root,
+        "rows": line_count,
+        "project_data_map": project_data_map,
+        "dirty_lines": dirty_lines_count
+    }
+
+
+def parse_tree_parallel(path, workers, chunk_bytes=CHUNK_BYTES):
+    """并行构建分类树，返回 (root, 有效行数)"""
+    result = scan_raw_file(path, workers, build_project_map=False, chunk_bytes=chunk_bytes)
+    return result["root"], result["rows"]
+
+
+def parse_project_map_parallel(path, workers, chunk_bytes=CHUNK_BYTES):
+    """并行构建 { 项目名称: (金额, 开始时间) }，返回 (project_data_map, 脏行数)"""
+    result = scan_raw_file(path, workers, build_tree=False, chunk_bytes=chunk_bytes)
+    return result["project_data_map"], result["dirty_lines"]
\ No newline at end of file
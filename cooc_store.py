@@ -0,0 +1,237 @@
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import msvcrt
+except ImportError:  # 非 Windows
+    msvcrt = None
+    import fcntl
+
+# ================= 多年份共现计数库 =================
+# step7 每处理一个年份，就把该年的组合计数存成一个很小的稀疏文件 (COO：标签编码对 + 次数)：
+#   store_dir/labels.json          所有年份共用的标签字典 (只追加，编码一旦分配就不再变化)
+#   store_dir/internal_2021.npz    a / b = 标签编码 (A 按字符串排序在 B 之前)，counts = 次数
+# 每年的组合按首次出现的先后保存，所以任意年份区间的结果 = 把各年的文件相加，
+# 次数相同时按 (年份, 年内首次出现位置) 排序 —— 与把这些年份的报表按年份顺序拼起来再跑 step7 完全一致。
+# 查询某个区间或滚动窗口时不需要再读任何全路径报表。
+#
+# 用法:
+#   python cooc_store.py range --store D:\predict\0.1\cooc_store --years 2014-2025 --output 2014_2025.csv
+#   python cooc_store.py rolling --store D:\predict\0.1\cooc_store --years 2014-2025 --window 3 --output-dir D:\x
+
+LABELS_FILE = "labels.json"
+INTERNAL = "internal"  # step7 的内部标签共现
+
+# 多个年份的 step7 可能同时写标签字典，用锁文件上的系统文件锁串行化
+LOCK_TIMEOUT_SECONDS = 120
+
+
+def year_path(store_dir, year, kind=INTERNAL):
+    return os.path.join(store_dir, f"{kind}_{year}.npz")
+
+
+def rank_pairs(paths_a, paths_b, counts):
+    """按次数降序排列；次数相同时保持原来的先后 (首次出现顺序)，与 Counter.most_common 一致"""
+    order = np.argsort(-np.asarray(counts, dtype=np.int64), kind="stable")
+    return paths_a[order], paths_b[order], counts[order]
+
+
+def _try_lock(f):
+    if msvcrt:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _unlock(f):
+    if msvcrt:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def _locked(store_dir):
+    """
+    锁文件一直保留、从不删除，互斥靠系统文件锁 (Windows 为 msvcrt.locking，其它系统为 flock)。
+    持锁的进程退出或被杀掉时由系统释放，不存在需要清理的过期锁。
+    """
+    lock_path = os.path.join(store_dir, LABELS_FILE + ".lock")
+    start_t = time.time()
+    with open(lock_path, 'a+b') as f:
+        while True:
+            try:
+                _try_lock(f)
+                break
+            except OSError:
+                if time.time() - start_t > LOCK_TIMEOUT_SECONDS:
+                    raise TimeoutError(f"等待标签字典锁超时: {lock_path}") from None
+                time.sleep(0.1)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def load_labels(store_dir):
+    path = os.path.join(store_dir, LABELS_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)["labels"]
+
+
+def encode_labels(store_dir, labels):
+    """返回 labels 在共享字典中的编码 (int32)，新标签追加到字典末尾"""
+    os.makedirs(store_dir, exist_ok=True)
+    with _locked(store_dir):
+        known = load_labels(store_dir)
+        index = pd.Index(known, dtype=object)
+        codes = index.get_indexer(pd.Index(labels, dtype=object))
+        new = list(dict.fromkeys(np.asarray(labels, dtype=object)[codes < 0].tolist()))
+        if new:
+            known.extend(new)
+            path = os.path.join(store_dir, LABELS_FILE)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"labels": known}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            codes = pd.Index(known, dtype=object).get_indexer(pd.Index(labels, dtype=object))
+    return codes.astype(np.int32)
+
+
+def save_year(path, paths_a, paths_b, counts):
+    """
+    保存一个年份的组合计数。paths_a / paths_b / counts 必须按首次出现的先后排列，
+    且每个组合的 A 按字符串排序在 B 之前 (step7 的 sparse_pair_counts 的输出)。
+    标签字典放在 path 所在目录。
+    """
+    store_dir = os.path.dirname(os.path.abspath(path))
+    paths_a = np.asarray(paths_a, dtype=object)
+    paths_b = np.asarray(paths_b, dtype=object)
+    codes = encode_labels(store_dir, np.concatenate([paths_a, paths_b]))
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, a=codes[:len(paths_a)], b=codes[len(paths_a):],
+             counts=np.asarray(counts, dtype=np.int64))
+    os.replace(tmp_path, path)
+    print(f"💾 共现计数已存入计数库: {path} ({len(paths_a)} 个组合)")
+
+
+def load_year(path):
+    with np.load(path) as data:
+        return data["a"], data["b"], data["counts"]
+
+
+def combine(parts, n_labels):
+    """
+    把若干年份 (按年份先后) 的 (a, b, counts) 相加；step7 也用它归并同一年按行先后切出的分片。
+    返回按首次出现先后排列的 (a, b, counts)：先比较最早出现的年份，再比较该年内的先后。
+    """
+    if not parts:
+        empty = np.empty(0, dtype=np.int32)
+        return empty, empty, np.empty(0, dtype=np.int64)
+    keys = np.concatenate([a.astype(np.int64) * n_labels + b for a, b, _ in parts])
+    counts = np.concatenate([c for _, _, c in parts])
+    # 拼接后的下标本身就是 (年份, 年内位置) 的先后
+    unique_keys, first_idx, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    totals = np.zeros(len(unique_keys), dtype=np.int64)
+    np.add.at(totals, inverse, counts)
+
+    order = np.argsort(first_idx)
+    unique_keys = unique_keys[order]
+    return ((unique_keys // n_labels).astype(np.int32), (unique_keys % n_labels).astype(np.int32), totals[order])
+
+
+def _load_parts(store_dir, years, kind, cache=None):
+    parts = []
+    missing = []
+    for year in years:
+        path = year_path(store_dir, year, kind)
+        if not os.path.exists(path):
+            missing.append(year)
+        elif cache is None:
+            parts.append(load_year(path))
+        else:
+            if year not in cache:
+                cache[year] = load_year(path)
+            parts.append(cache[year])
+    if missing:
+        print(f"⚠️ 计数库中缺少这些年份 (需要先运行 step7): {missing}")
+    return parts
+
+
+def query_range(store_dir, years, kind=INTERNAL, _cache=None):
+    """
+    任意年份集合的合计：返回 (A 数组, B 数组, 次数数组)，按次数降序 (与 step7 的输出顺序规则相同)。
+    """
+    labels = np.asarray(load_labels(store_dir), dtype=object)
+    a, b, counts = combine(_load_parts(store_dir, sorted(years), kind, _cache), max(len(labels), 1))
+    return rank_pairs(labels[a], labels[b], counts)
+
+
+def rolling_totals(store_dir, years, window, kind=INTERNAL):
+    """滚动窗口：依次产出 (起始年份, 结束年份, query_range 的结果)，每个年份文件只读一次"""
+    years = sorted(years)
+    cache = {}
+    for start in range(len(years) - window + 1):
+        span = years[start:start + window]
+        yield span[0], span[-1], query_range(store_dir, span, kind, cache)
+
+
+def _result_frame(result):
+    # 与 step7 输出的 CSV 格式一致 (step7 的文件名含中文，只能通过 importlib 按名称导入)
+    step7 = importlib.import_module("step7_统计原标签共现")
+    return step7.build_result_frame(*result)
+
+
+def main():
+    from atas import parse_range_list
+
+    parser = argparse.ArgumentParser(description="从多年份共现计数库中查询年份区间 / 滚动窗口的合计")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("range", "年份区间合计"), ("rolling", "滚动窗口合计")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--store", required=True, help="计数库目录 (step7 的 cooc_path 所在目录)")
+        p.add_argument("--years", required=True, help="例如 2014-2025 或 2014,2016-2018")
+        p.add_argument("--kind", default=INTERNAL, help="计数类型 (文件名前缀)")
+        p.add_argument("--top", type=int, default=10, help="打印前几条")
+    sub.choices["range"].add_argument("--output", help="结果 CSV 路径")
+    sub.choices["rolling"].add_argument("--window", type=int, required=True, help="窗口长度 (年)")
+    sub.choices["rolling"].add_argument("--output-dir", help="每个窗口输出一个 CSV 的目录")
+    args = parser.parse_args()
+
+    years = parse_range_list(args.years)
+    start_t = time.time()
+    if args.command == "range":
+        df = _result_frame(query_range(args.store, years, args.kind))
+        print(f"📊 {years[0]}-{years[-1]}: {len(df)} 个组合，耗时 {time.time() - start_t:.2f}s")
+        print(df.head(args.top).to_string())
+        if args.output:
+            df.to_csv(args.output, index=False, encoding='utf-8-sig')
+            print(f"💾 已保存: {args.output}")
+        return
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    for first_year, last_year, result in rolling_totals(args.store, years, args.window, args.kind):
+        df = _result_frame(result)
+        top = df.iloc[0] if len(df) else None
+        summary = f"最多: {top['归属组合(简化)']} ({top['同时出现次数']})" if top is not None else "无组合"
+        print(f"📊 {first_year}-{last_year}: {len(df)} 个组合，{summary}")
+        if args.output_dir:
+            df.to_csv(os.path.join(args.output_dir, f"{args.kind}_{first_year}_{last_year}.csv"),
+                      index=False, encoding='utf-8-sig')
+    print(f"✅ 完成，耗时 {time.time() - start_t:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,99 +1,63 @@
 import pandas as pd
+import numpy as np
 import os
+import time
+
+from raw_reader import iter_lines, parse_source_line, load_project_data, project_data_path
 
 # --- 配置路径 ---
 source_file_path = r"D:\predict\0.1\data\2025.csv"
 target_file_path = r"D:\predict\0.1\data\2025_Project_Flattened_Report_FullPath.csv"
 
+# 解析源文件的进程数：1 为逐行串行解析；大于 1 时按字节区间切块并行解析 (结果与串行完全一致)
+PARSE_WORKERS = 1
 
-def clean_text(text):
-    """清理函数：去除多余的引号和首尾空格"""
-    if not text:
-        return ""
-    # 替换掉 CSV 中常见的双引号 wrapper
-    clean = text.replace('"""', '').replace('"', '').strip()
-    return clean
-
+# 匹配填充方式："vectorized" 整列 map 一次完成；"loop" 为旧的 iterrows + df.at 逐行写入
+MATCH_MODE = "vectorized"
+# 计时对比：取前 N 行分别用两种方式跑一遍，打印耗时并核对结果一致。
+# 默认 0 不对比 (对比会把旧的逐行方式也跑一遍)；需要时用 python datacollection.py --compare 20000
+COMPARE_SAMPLE_ROWS = 0
 
-try:
-    # ---------------------------------------------------------
-    # 1. 读取源文件并构建字典 (Hash Map)
-    # ---------------------------------------------------------
-    print(f"正在读取并解析源文件: {source_file_path}")
 
-    # 数据字典结构: { "项目名称": ("金额", "开始时间") }
-    project_data_map = {}
+def collect_project_data(lines, project_data_map):
+    """
+    逐行解析源数据，写入 project_data_map: { "项目名称": ("金额", "开始时间") }
+    返回忽略的脏行/空名行数
+    """
     dirty_lines_count = 0
 
-    with open(source_file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-
-            parts = line.split('###')
-
-            # 简单的脏数据过滤：如果切分后少于4部分，说明该行格式严重错误
-            if len(parts) < 4:
-                dirty_lines_count += 1
-                continue
-
-            # 提取数据
-            # 第1列(索引0): 项目名称 (用于匹配)
-            # 第2列(索引1): 金额
-            # 第4列(索引3): 开始时间
-            p_name = clean_text(parts[0])
-            p_amount = clean_text(parts[1])
-            p_time = clean_text(parts[3])
-
-            # 只有项目名称不为空才存入
-            if p_name:
-                project_data_map[p_name] = (p_amount, p_time)
-            else:
-                dirty_lines_count += 1
+    for line in lines:
+        record = parse_source_line(line)
+        if record is None:
+            dirty_lines_count += 1
+            continue
+        project_data_map[record[0]] = record[1:]
 
-    print(f"源文件解析完成。有效项目: {len(project_data_map)} 个，忽略脏行/空名: {dirty_lines_count} 行。")
+    return dirty_lines_count
 
-    # ---------------------------------------------------------
-    # 2. 读取目标文件
-    # ---------------------------------------------------------
-    print(f"正在读取目标文件: {target_file_path}")
-    try:
-        df_target = pd.read_csv(target_file_path, encoding='gbk')
-    except UnicodeDecodeError:
-        df_target = pd.read_csv(target_file_path, encoding='utf-8')
-
-    # ---------------------------------------------------------
-    # 3. 准备目标文件的列 (扩充到至少10列)
-    # ---------------------------------------------------------
-    # Excel I列是第9列(Index 8)，J列是第10列(Index 9)
-    while df_target.shape[1] < 10:
-        new_col_idx = df_target.shape[1]
-        # 如果是填充I列，列名暂定 Amount_Extracted，J列暂定 Time_Extracted
-        if new_col_idx == 8:
-            col_name = "Amount_Extracted"
-        elif new_col_idx == 9:
-            col_name = "Time_Extracted"
-        else:
-            col_name = f"Unnamed_{new_col_idx}"
-        df_target[col_name] = ""
 
-    # 获取 I列 和 J列 的列名
-    col_name_I = df_target.columns[8]
-    col_name_J = df_target.columns[9]
+def load_project_data_map(path, workers=1):
+    """
+    读取源文件并构建字典 (Hash Map)，返回 (project_data_map, dirty_lines_count)
+    step2 扫描同一个源文件时已经保存了字典 (且源文件之后没有改动) 的话直接读取
+    """
+    cached = load_project_data(path)
+    if cached is not None:
+        print(f"使用 step2 扫描时一并保存的金额/时间字典: {project_data_path(path)}")
+        return cached
 
-    # ---------------------------------------------------------
-    # 4. 遍历匹配并更新
-    # ---------------------------------------------------------
-    print("正在进行项目名称匹配和数据填充...")
+    if workers > 1:
+        from chunked_parse import parse_project_map_parallel
+        return parse_project_map_parallel(path, workers=workers)
 
-    matched_count = 0
+    project_data_map = {}
+    dirty_lines_count = collect_project_data(iter_lines(path), project_data_map)
+    return project_data_map, dirty_lines_count
 
-    # 获取目标文件第一列的列名（假设第一列是项目名称）
-    target_key_col = df_target.columns[0]
 
-    # 为了提高效率，我们将需要更新的列转换为列表或使用 apply，但循环对于几十万行也很快且逻辑清晰
-    # 这里使用逐行查找更新
+def fill_columns_loop(df_target, project_data_map, target_key_col, col_name_I, col_name_J):
+    """旧方式：逐行查找更新，返回匹配行数"""
+    matched_count = 0
 
     for index, row in df_target.iterrows():
         # 获取目标文件的项目名称 (清理一下空格以提高匹配率)
@@ -109,20 +73,137 @@ try:
 
             matched_count += 1
 
-    # ---------------------------------------------------------
-    # 5. 保存结果
-    # ---------------------------------------------------------
-    print(f"匹配完成！共成功匹配并更新了 {matched_count} 行数据。")
-    print("正在保存文件...")
+    return matched_count
+
+
+def fill_columns_vectorized(df_target, project_data_map, target_key_col, col_name_I, col_name_J):
+    """向量化：项目名称建成索引，对清理后的键列整列查位置，一次写入 I/J 两列，返回匹配行数"""
+    if not project_data_map:
+        return 0
+
+    name_index = pd.Index(list(project_data_map.keys()), dtype=object)
+    values = np.empty((len(project_data_map), 2), dtype=object)
+    values[:] = list(project_data_map.values())
+
+    # 与逐行版本相同的键：str() 后去掉首尾空格
+    keys = df_target[target_key_col].astype(str).str.strip()
+    positions = name_index.get_indexer(keys)
+    matched = positions >= 0
+    matched_count = int(matched.sum())
+
+    if matched_count:
+        hit = positions[matched]
+        for col_name, field in ((col_name_I, 0), (col_name_J, 1)):
+            # 先转成 object，避免数值列写入字符串时的类型冲突 (逐行 df.at 写入时同样会变成 object)
+            df_target[col_name] = df_target[col_name].astype(object)
+            df_target.loc[matched, col_name] = values[hit, field]
+
+    return matched_count
+
+
+def compare_fill_timing(df_target, project_data_map, target_key_col, col_name_I, col_name_J, sample_rows):
+    """在前 sample_rows 行上分别运行两种方式，打印耗时并核对结果"""
+    sample = df_target.head(sample_rows).copy()
+    # 新版 pandas 不允许逐行把字符串写进数值列，对比前统一转成 object
+    sample[col_name_I] = sample[col_name_I].astype(object)
+    sample[col_name_J] = sample[col_name_J].astype(object)
+    df_loop = sample.copy()
+    df_vec = sample.copy()
+
+    start_t = time.time()
+    fill_columns_loop(df_loop, project_data_map, target_key_col, col_name_I, col_name_J)
+    loop_seconds = time.time() - start_t
+
+    start_t = time.time()
+    fill_columns_vectorized(df_vec, project_data_map, target_key_col, col_name_I, col_name_J)
+    vec_seconds = time.time() - start_t
+
+    same = df_loop.astype(str).equals(df_vec.astype(str))
+    print(f"计时对比 (前 {len(sample)} 行): 逐行 {loop_seconds:.3f}s，向量化 {vec_seconds:.3f}s，"
+          f"加速 {loop_seconds / max(vec_seconds, 1e-9):.1f} 倍，结果{'一致' if same else '不一致！'}")
+
+
+def main(compare_rows=COMPARE_SAMPLE_ROWS):
+    try:
+        # ---------------------------------------------------------
+        # 1. 读取源文件并构建字典 (Hash Map)
+        # ---------------------------------------------------------
+        print(f"正在读取并解析源文件: {source_file_path}")
+
+        # 数据字典结构: { "项目名称": ("金额", "开始时间") }
+        project_data_map, dirty_lines_count = load_project_data_map(source_file_path, workers=PARSE_WORKERS)
+
+        print(f"源文件解析完成。有效项目: {len(project_data_map)} 个，忽略脏行/空名: {dirty_lines_count} 行。")
+
+        # ---------------------------------------------------------
+        # 2. 读取目标文件
+        # ---------------------------------------------------------
+        print(f"正在读取目标文件: {target_file_path}")
+        try:
+            df_target = pd.read_csv(target_file_path, encoding='gbk')
+        except UnicodeDecodeError:
+            df_target = pd.read_csv(target_file_path, encoding='utf-8')
+
+        # ---------------------------------------------------------
+        # 3. 准备目标文件的列 (扩充到至少10列)
+        # ---------------------------------------------------------
+        # Excel I列是第9列(Index 8)，J列是第10列(Index 9)
+        while df_target.shape[1] < 10:
+            new_col_idx = df_target.shape[1]
+            # 如果是填充I列，列名暂定 Amount_Extracted，J列暂定 Time_Extracted
+            if new_col_idx == 8:
+                col_name = "Amount_Extracted"
+            elif new_col_idx == 9:
+                col_name = "Time_Extracted"
+            else:
+                col_name = f"Unnamed_{new_col_idx}"
+            df_target[col_name] = ""
+
+        # 获取 I列 和 J列 的列名
+        col_name_I = df_target.columns[8]
+        col_name_J = df_target.columns[9]
+
+        # ---------------------------------------------------------
+        # 4. 匹配并更新
+        # ---------------------------------------------------------
+        print("正在进行项目名称匹配和数据填充...")
+
+        # 获取目标文件第一列的列名（假设第一列是项目名称）
+        target_key_col = df_target.columns[0]
+
+        if compare_rows:
+            compare_fill_timing(df_target, project_data_map, target_key_col, col_name_I, col_name_J, compare_rows)
+
+        start_t = time.time()
+        if MATCH_MODE == "loop":
+            matched_count = fill_columns_loop(df_target, project_data_map, target_key_col, col_name_I, col_name_J)
+        else:
+            matched_count = fill_columns_vectorized(df_target, project_data_map, target_key_col, col_name_I, col_name_J)
+        print(f"匹配填充耗时: {time.time() - start_t:.2f}s ({MATCH_MODE})")
+
+        # ---------------------------------------------------------
+        # 5. 保存结果
+        # ---------------------------------------------------------
+        print(f"匹配完成！共成功匹配并更新了 {matched_count} 行数据。")
+        print("正在保存文件...")
+
+        df_target.to_csv(target_file_path, index=False, encoding='utf-8-sig')
+
+        print(f"处理完毕。结果已保存至: {target_file_path}")
+
+    except FileNotFoundError:
+        print("错误：找不到文件，请检查路径。")
+    except Exception as e:
+        import traceback
 
-    df_target.to_csv(target_file_path, index=False, encoding='utf-8-sig')
+        print(f"发生未知错误: {e}")
+        print(traceback.format_exc())
 
-    print(f"处理完毕。结果已保存至: {target_file_path}")
 
-except FileNotFoundError:
-    print("错误：找不到文件，请检查路径。")
-except Exception as e:
-    import traceback
+if __name__ == "__main__":
+    import argparse
 
-    print(f"发生未知错误: {e}")
-    print(traceback.format_exc())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="按项目名称把源文件的金额/开始时间填入目标报表")
+    parser.add_argument("--compare", type=int, default=COMPARE_SAMPLE_ROWS, metavar="N",
+                        help="先在前 N 行上对比逐行与向量化填充的耗时 (默认不对比)")
+    main(compare_rows=parser.parse_args().compare)
\ No newline at end of file
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# ================= 增量向量缓存 =================
+# 以 hash(模型路径, 池化配置, 规范化文本) 为键保存每条文本的向量 (SQLite 单文件)。
+# - 只对库里没有的文本调用模型，新增一个项目只需要算这一个项目
+# - 不同年份共用同一个库，往年出现过的项目名称直接命中
+# - 编码前先按规范化文本去重，同一个项目名称出现在多个分类下也只算一次
+# - 超过容量上限时按最近使用时间淘汰最旧的向量；向量总字节数记在 meta 表里，
+#   与写入/删除在同一个事务中更新，写入时不必再扫描整张表
+
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3  # 4GB
+_SQL_BATCH = 500  # 每条 SQL 里最多带多少个键 (SQLite 参数个数有上限)
+_TOTAL_BYTES = "total_bytes"
+
+
+def normalize_text(text):
+    """规范化文本：转成字符串、合并连续空白、去掉首尾空白"""
+    return " ".join(str(text).split())
+
+
+def dedup_texts(texts):
+    """
+    按规范化文本去重。
+    返回 (去重后的文本列表, inverse)，其中 unique[inverse[i]] 对应 texts[i]
+    """
+    index = {}
+    inverse = np.empty(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        text = normalize_text(text)
+        j = index.get(text)
+        if j is None:
+            j = index[text] = len(index)
+        inverse[i] = j
+    return list(index), inverse
+
+
+def report_dedup(n_rows, n_unique, n_encoded, encode_seconds):
+    """打印去重比例，并按实测的单条编码耗时估算节省的时间"""
+    ratio = n_unique / n_rows if n_rows else 1.0
+    print(f"🔁 去重: {n_rows} 条 -> {n_unique} 个不同文本 (保留 {ratio:.1%})，实际编码 {n_encoded} 条")
+    if n_encoded and encode_seconds > 0:
+        per_text = encode_seconds / n_encoded
+        saved_dedup = (n_rows - n_unique) * per_text
+        saved_cache = (n_unique - n_encoded) * per_text
+        print(f"   编码耗时 {encode_seconds:.1f}s，估计去重节省 {saved_dedup:.1f}s，缓存命中节省 {saved_cache:.1f}s")
+
+
+def encode_deduplicated(texts, encode_fn):
+    """每个不同的规范化文本只编码一次，再按 inverse 下标散回到每一行"""
+    unique, inverse = dedup_texts(texts)
+    start_t = time.time()
+    vectors = np.asarray(encode_fn(unique), dtype=np.float32)
+    report_dedup(len(texts), len(unique), len(unique), time.time() - start_t)
+    return vectors[inverse]
+
+
+class EmbeddingStore:
+    def __init__(self, path, model_path, pooling="cls", max_bytes=DEFAULT_MAX_BYTES):
+        """
+        path       : 缓存库文件，例如 D:\\predict\\0.1\\embedding_store.sqlite
+        model_path : 模型路径，作为键的一部分；换模型后旧向量自然不会命中
+        pooling    : 池化/截断等会影响向量的配置描述，同样作为键的一部分
+        max_bytes  : 向量总大小上限，超出后按最近使用时间淘汰
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._prefix = f"{model_path}\0{pooling}\0".encode('utf-8')
+
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.commit()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # 旧版本的库没有记录总字节数，只在第一次打开时统计一次
+            if self.conn.execute("SELECT 1 FROM meta WHERE name = ?", (_TOTAL_BYTES,)).fetchone() is None:
+                self.conn.execute(
+                    "INSERT INTO meta (name, value) SELECT ?, COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings",
+                    (_TOTAL_BYTES,))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def make_key(self, normalized_text):
+        return hashlib.blake2b(self._prefix + normalized_text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get_many(self, keys):
+        """按键批量读取，返回 { key: 向量 }，并刷新这些键的最近使用时间"""
+        found = {}
+        now = time.time()
+        for i in range(0, len(keys), _SQL_BATCH):
+            batch = keys[i:i + _SQL_BATCH]
+            marks = ",".join("?" * len(batch))
+            rows = self.conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", batch).fetchall()
+            for key, vec in rows:
+                found[key] = np.frombuffer(vec, dtype=np.float32)
+            if rows:
+                self.conn.execute(f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now] + batch)
+        self.conn.commit()
+        return found
+
+    def _stored_bytes(self, keys):
+        """库里已有的这些键的向量字节数 (按主键查找，不扫描整张表)"""
+        total = 0
+        for i in range(0, len(keys), _SQL_BATCH):
+            batch = keys[i:i + _SQL_BATCH]
+            marks = ",".join("?" * len(batch))
+            total += self.conn.execute(
+                f"SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings WHERE key IN ({marks})", batch).fetchone()[0]
+        return total
+
+    def _add_bytes(self, delta):
+        self.conn.execute("UPDATE meta SET value = value + ? WHERE name = ?", (delta, _TOTAL_BYTES))
+
+    def put_many(self, keys, vectors):
+        """批量写入向量 (float32)，同一个事务里更新总字节数，写完后检查容量"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        now = time.time()
+        # 同一批里重复的键只保留最后一个 (与 INSERT OR REPLACE 的结果一致)
+        rows = list({key: (key, vec.shape[0], vec.tobytes(), now) for key, vec in zip(keys, vectors)}.values())
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            replaced = self._stored_bytes([row[0] for row in rows])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vec, last_used) VALUES (?, ?, ?, ?)", rows)
+            self._add_bytes(sum(len(row[2]) for row in rows) - replaced)
+        self.evict()
+
+    def size_bytes(self):
+        return self.conn.execute("SELECT value FROM meta WHERE name = ?", (_TOTAL_BYTES,)).fetchone()[0]
+
+    def evict(self):
+        """超过容量上限时，按最近使用时间从旧到新删除，直到降到上限的 90%"""
+        if self.size_bytes() <= self.max_bytes:
+            return 0
+
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # 拿到写锁后重新读取 (其它进程可能刚淘汰过)
+            total = self.size_bytes()
+            freed = 0
+            while total - freed > target:
+                rows = self.conn.execute(
+                    "SELECT key, LENGTH(vec) FROM embeddings ORDER BY last_used LIMIT ?", (_SQL_BATCH,)
+                ).fetchall()
+                if not rows:
+                    break
+                drop = []
+                for key, size in rows:
+                    drop.append(key)
+                    freed += size
+                    if total - freed <= target:
+                        break
+                self.conn.execute(f"DELETE FROM embeddings WHERE key IN ({','.join('?' * len(drop))})", drop)
+                removed += len(drop)
+            self._add_bytes(-freed)
+        if removed:
+            print(f"🧹 向量缓存超过上限，已淘汰 {removed} 条最久未使用的向量")
+        return removed
+
+    def put_texts(self, normalized_texts, vectors):
+        """按 (已规范化的) 文本写入向量，供编码过程中分批落盘使用"""
+        self.put_many([self.make_key(t) for t in normalized_texts], vectors)
+
+    def encode(self, texts, encode_fn, stream=False):
+        """
+        返回与 texts 一一对应的向量矩阵。
+        先按规范化文本去重，只有库里没有的文本才会交给 encode_fn(文本列表) -> ndarray 计算，
+        算完立即写入库，最后按 inverse 下标散回到每一行。
+        stream=True 时以 encode_fn(文本列表, save) 调用，encode_fn 每算完一部分就调用
+        save(部分文本, 部分向量) 写入库，中途崩溃时已完成的部分不会丢失。
+        """
+        unique, inverse = dedup_texts(texts)
+        keys = [self.make_key(t) for t in unique]
+        found = self.get_many(keys)
+
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        print(f"💾 向量缓存命中 {len(unique) - len(missing)}/{len(unique)} 个不同文本，需要新计算 {len(missing)} 个")
+
+        encode_seconds = 0.0
+        if missing:
+            start_t = time.time()
+            missing_texts = [unique[i] for i in missing]
+            if stream:
+                new_vectors = np.asarray(encode_fn(missing_texts, self.put_texts), dtype=np.float32)
+            else:
+                new_vectors = np.asarray(encode_fn(missing_texts), dtype=np.float32)
+            encode_seconds = time.time() - start_t
+            new_keys = [keys[i] for i in missing]
+            if not stream:
+                self.put_many(new_keys, new_vectors)
+            found.update(zip(new_keys, new_vectors))
+
+        report_dedup(len(texts), len(unique), len(missing), encode_seconds)
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[k] for k in keys])[inverse]
\ No newline at end of file
@@ -0,0 +1,202 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# ================= BGE 模型加载与编码 =================
+# torch / sentence_transformers 导入很慢、占用内存大，只在真正加载模型时才导入，
+# 这样全部命中缓存的运行 (以及只 import 本模块的脚本) 不会付出这部分启动开销。
+
+# 按长度分桶编码时，每个批次的 token 预算 (批大小 × 该批最长长度)
+DEFAULT_TOKEN_BUDGET = 8192
+# bge 模型支持的最大长度
+MODEL_MAX_SEQ_LENGTH = 512
+# CPU 进程池每个分片的条数；崩溃时最多丢失正在计算的分片
+DEFAULT_SHARD_SIZE = 2000
+
+
+def load_bge_model(model_path, max_seq_length=MODEL_MAX_SEQ_LENGTH, device=None):
+    """手动组装 Transformer + CLS 池化 (模型目录里没有 modules.json 也能加载)"""
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    print(f"\n⬇️  正在加载模型: {model_path}")
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"🖥️  运行设备: {device}")
+
+    word_embedding_model = models.Transformer(model_path, max_seq_length=max_seq_length)
+    pooling_model = models.Pooling(word_embedding_model.get_word_embedding_dimension(), pooling_mode_cls_token=True)
+    return SentenceTransformer(modules=[word_embedding_model, pooling_model], device=device)
+
+
+def token_lengths(model, texts):
+    """每条文本分词后的长度 (含 [CLS]/[SEP]，不截断)"""
+    if not texts:
+        return np.zeros(0, dtype=np.int64)
+    encoded = model.tokenizer(list(texts), add_special_tokens=True, truncation=False)
+    return np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(texts))
+
+
+def choose_max_seq_length(lengths, quantile=1.0, limit=MODEL_MAX_SEQ_LENGTH, multiple=8):
+    """
+    按实际长度分布选择截断长度：取 quantile 分位数，向上取整到 multiple 的倍数，不超过 limit。
+    quantile=1.0 时等于最长文本的长度，不会截断任何 (原本不会被 512 截断的) 文本。
+    """
+    if len(lengths) == 0:
+        return limit
+    cap = int(np.ceil(np.quantile(lengths, quantile)))
+    cap = -(-cap // multiple) * multiple
+    return max(multiple, min(cap, limit))
+
+
+def make_length_buckets(lengths, token_budget=DEFAULT_TOKEN_BUDGET, cap=MODEL_MAX_SEQ_LENGTH):
+    """
+    按长度从短到长排序后切批：每批的 (条数 × 本批最长长度) 不超过 token_budget。
+    短文本的批次条数多、长文本的批次条数少，补齐 (padding) 的浪费很小。
+    返回每批的下标数组列表。
+    """
+    order = np.argsort(lengths, kind="stable")
+    clipped = np.minimum(lengths[order], cap)
+
+    buckets = []
+    start = 0
+    n = len(order)
+    while start < n:
+        end = start + 1
+        # 排好序后当前元素就是本批最长的，批越大越接近预算
+        while end < n and (end - start + 1) * clipped[end] <= token_budget:
+            end += 1
+        buckets.append(order[start:end])
+        start = end
+    return buckets
+
+
+def encode_fixed(model, texts, batch_size=64, normalize=True, show_progress_bar=True):
+    """原来的方式：固定批大小、固定 max_seq_length，附带 token/秒 统计"""
+    lengths = np.minimum(token_lengths(model, texts), model.max_seq_length)
+    start_t = time.time()
+    vectors = model.encode(texts, normalize_embeddings=normalize, batch_size=batch_size,
+                           show_progress_bar=show_progress_bar)
+    seconds = time.time() - start_t
+    print(f"📈 固定批次: {len(texts)} 条, {int(lengths.sum())} tokens, "
+          f"{seconds:.1f}s, {lengths.sum() / max(seconds, 1e-9):.0f} tokens/秒")
+    return vectors
+
+
+def encode_bucketed(model, texts, token_budget=DEFAULT_TOKEN_BUDGET, quantile=1.0, normalize=True,
+                    show_progress_bar=True):
+    """
+    按 token 长度分桶编码：
+    1. 分词得到每条长度，按分布选出截断长度 (见 choose_max_seq_length)
+    2. 从短到长按 token 预算切批，每批把 max_seq_length 设为本批最长长度
+    3. 结果按原顺序放回
+    """
+    texts = list(texts)
+    lengths = token_lengths(model, texts)
+    cap = choose_max_seq_length(lengths, quantile)
+    buckets = make_length_buckets(lengths, token_budget, cap)
+    print(f"📏 长度分布: 中位数 {int(np.median(lengths)) if len(lengths) else 0}, 最长 {int(lengths.max()) if len(lengths) else 0}, "
+          f"截断长度 {cap}, 共 {len(buckets)} 个批次 (token 预算 {token_budget})")
+
+    dim = model.get_sentence_embedding_dimension()
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+
+    old_max_seq_length = model.max_seq_length
+    real_tokens = 0
+    padded_tokens = 0
+    start_t = time.time()
+    try:
+        for i, idx in enumerate(buckets):
+            bucket_len = int(min(lengths[idx[-1]], cap))
+            model.max_seq_length = bucket_len
+            out[idx] = model.encode([texts[j] for j in idx], normalize_embeddings=normalize,
+                                    batch_size=len(idx), show_progress_bar=False)
+            real_tokens += int(np.minimum(lengths[idx], cap).sum())
+            padded_tokens += bucket_len * len(idx)
+            if show_progress_bar and (i + 1) % 50 == 0:
+                print(f"   已完成 {i + 1}/{len(buckets)} 批 ({time.time() - start_t:.1f}s)")
+    finally:
+        model.max_seq_length = old_max_seq_length
+
+    seconds = time.time() - start_t
+    print(f"📈 分桶编码: {len(texts)} 条, {real_tokens} tokens (含补齐 {padded_tokens}), "
+          f"{seconds:.1f}s, {real_tokens / max(seconds, 1e-9):.0f} tokens/秒")
+    return out
+
+# ================= CPU 多进程编码 =================
+# 短文本上 torch 单进程的线程扩展性很差，改为多个进程各自加载一份模型、各算一部分。
+
+_worker_model = None
+
+
+def _init_cpu_worker(model_path, torch_threads):
+    """子进程初始化：限制 torch 线程数，并在本进程内只加载一次模型"""
+    global _worker_model
+    import torch
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    _worker_model = load_bge_model(model_path, device="cpu")
+
+
+def _encode_shard(args):
+    shard_id, texts, mode, batch_size, token_budget, quantile = args
+    start_t = time.time()
+    if mode == "bucketed":
+        vectors = encode_bucketed(_worker_model, texts, token_budget=token_budget, quantile=quantile,
+                                  show_progress_bar=False)
+    else:
+        vectors = encode_fixed(_worker_model, texts, batch_size=batch_size, show_progress_bar=False)
+    return shard_id, np.asarray(vectors, dtype=np.float32), time.time() - start_t
+
+
+def encode_with_cpu_pool(model_path, texts, workers=None, torch_threads=None, shard_size=DEFAULT_SHARD_SIZE,
+                         mode="bucketed", batch_size=64, token_budget=DEFAULT_TOKEN_BUDGET, quantile=1.0,
+                         on_shard_done=None):
+    """
+    把 texts 切成分片，交给 workers 个子进程编码 (每个进程加载一次模型)，按原顺序拼回。
+    torch_threads : 每个进程的 torch 线程数，默认 CPU 核数 / 进程数
+    on_shard_done : 每个分片完成时回调 on_shard_done(分片文本, 分片向量)，用于把结果立即写入向量缓存
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    cpu_count = os.cpu_count() or 1
+    workers = workers or max(1, cpu_count // 4)
+    torch_threads = torch_threads or max(1, cpu_count // workers)
+
+    shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+    workers = min(workers, len(shards))
+    print(f"🧵 CPU 进程池编码: {len(texts)} 条, {len(shards)} 个分片, {workers} 个进程 × {torch_threads} 线程")
+
+    results = [None] * len(shards)
+    start_t = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_cpu_worker,
+                             initargs=(model_path, torch_threads)) as pool:
+        futures = [
+            pool.submit(_encode_shard, (i, shard, mode, batch_size, token_budget, quantile))
+            for i, shard in enumerate(shards)
+        ]
+        first_error = None
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                shard_id, vectors, seconds = future.result()
+            except Exception as e:
+                # 某个分片失败时继续收集其它分片，已完成的照常写入缓存，最后再抛出
+                print(f"❌ 有分片编码失败: {e}")
+                first_error = first_error or e
+                continue
+            results[shard_id] = vectors
+            if on_shard_done is not None:
+                on_shard_done(shards[shard_id], vectors)
+            print(f"   分片 {shard_id + 1} 完成 ({len(vectors)} 条, {seconds:.1f}s)，"
+                  f"进度 {done}/{len(shards)}，已用 {time.time() - start_t:.1f}s")
+
+    if first_error is not None:
+        raise first_error
+
+    seconds = time.time() - start_t
+    print(f"📈 进程池编码完成: {len(texts)} 条, {seconds:.1f}s, {len(texts) / max(seconds, 1e-9):.1f} 条/秒")
+    return np.concatenate(results)
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+
+import pandas as pd
+
+# ================= 阶段之间的列式中间文件 =================
+# 各阶段之间原来用 utf-8-sig CSV / xlsx 交接 (openpyxl 读写尤其慢)。
+# 这里在每个 CSV/xlsx 旁边额外写一份列式文件 (默认 Parquet，可选 Feather)：
+#   - 重复度高的文本列 (路径、标签) 存为字典编码 (category)
+#   - 相似度列存为 float32
+# 下游优先读取列式文件；CSV/xlsx 只作为给人看的导出结果。
+# 没有安装 pyarrow 时自动退回到只读写 CSV/xlsx。
+
+INTERMEDIATE_FORMAT = "parquet"  # "parquet" 或 "feather"
+_SUFFIXES = {"parquet": ".parquet", "feather": ".feather"}
+
+# 不同值占比低于这个比例的文本列按字典编码保存
+CATEGORY_MAX_RATIO = 0.5
+# 以这些前缀开头的列是相似度分数，按 float32 保存
+SCORE_PREFIXES = ("相似度",)
+
+
+def intermediate_path(path, fmt=INTERMEDIATE_FORMAT):
+    """D:\\x\\2021_Project_Final_Fixed.csv -> D:\\x\\2021_Project_Final_Fixed.parquet"""
+    return os.path.splitext(path)[0] + _SUFFIXES[fmt]
+
+
+def to_columnar(df):
+    """转换成适合列式存储的类型：重复文本 -> category，相似度 -> float32 (不修改原 DataFrame)"""
+    out = df.copy()
+    for col in out.columns:
+        series = out[col]
+        if str(col).startswith(SCORE_PREFIXES) and pd.api.types.is_float_dtype(series):
+            out[col] = series.astype("float32")
+        elif series.dtype == object or pd.api.types.is_string_dtype(series):
+            if len(series) and series.nunique(dropna=False) <= CATEGORY_MAX_RATIO * len(series):
+                out[col] = series.astype("category")
+    return out
+
+
+def _write_columnar(df, path, fmt):
+    columnar = to_columnar(df).reset_index(drop=True)
+    if fmt == "feather":
+        columnar.to_feather(path)
+    else:
+        columnar.to_parquet(path, index=False)
+
+
+def write_frame(df, path, fmt=INTERMEDIATE_FORMAT, export=True, **export_kwargs):
+    """
+    按 path 的后缀导出 CSV (utf-8-sig) 或 xlsx，再写入列式中间文件 (后写，修改时间不早于导出文件)。
+    export=False 时只写列式文件；缺少 pyarrow 时只导出 CSV/xlsx。
+    xlsx 导出缺少 openpyxl 时只打印警告，列式文件照常可用。
+    """
+    columnar_path = intermediate_path(path, fmt)
+    excel_failed = False
+    if export:
+        if path.lower().endswith((".xlsx", ".xls")):
+            try:
+                df.to_excel(path, index=False, **export_kwargs)
+            except ImportError:
+                excel_failed = True
+        else:
+            export_kwargs.setdefault("encoding", "utf-8-sig")
+            df.to_csv(path, index=False, **export_kwargs)
+
+    try:
+        _write_columnar(df, columnar_path, fmt)
+    except ImportError:
+        if excel_failed or not export:
+            raise
+        print(f"⚠️ 缺少 pyarrow，跳过 {fmt} 中间文件，只保存 {os.path.basename(path)}")
+        return path
+    except Exception as e:
+        # 例如同一列里混有数字和文本，Arrow 无法确定类型；删除旧的中间文件，下游会读导出文件
+        if excel_failed or not export:
+            raise
+        print(f"⚠️ {fmt} 中间文件写入失败 ({e})，只保存 {os.path.basename(path)}")
+        if os.path.exists(columnar_path):
+            os.remove(columnar_path)
+        return path
+    if excel_failed:
+        print(f"⚠️ 缺少 openpyxl 库，Excel 导出失败，但 {os.path.basename(columnar_path)} 已保存")
+    return columnar_path
+
+
+def read_frame(path, fmt=INTERMEDIATE_FORMAT, categorical=False, **csv_kwargs):
+    """
+    读取某个阶段的结果：列式文件存在且不比 CSV/xlsx 旧时直接读取，否则读 CSV/xlsx。
+    categorical=False 时把字典编码列还原成普通文本列 (与读 CSV 得到的类型一致，可以直接 fillna(""))。
+    """
+    columnar_path = intermediate_path(path, fmt)
+    if os.path.exists(columnar_path) and (
+            not os.path.exists(path) or os.path.getmtime(columnar_path) >= os.path.getmtime(path)):
+        try:
+            df = pd.read_feather(columnar_path) if fmt == "feather" else pd.read_parquet(columnar_path)
+            if not categorical:
+                for col in df.columns:
+                    if isinstance(df[col].dtype, pd.CategoricalDtype):
+                        df[col] = df[col].astype(object)
+            return df
+        except ImportError:
+            print(f"⚠️ 缺少 pyarrow，改为读取 {os.path.basename(path)}")
+
+    if path.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(path)
+    csv_kwargs.setdefault("encoding", "utf-8-sig")
+    return pd.read_csv(path, **csv_kwargs)
+
+
+def frame_exists(path, fmt=INTERMEDIATE_FORMAT):
+    return os.path.exists(intermediate_path(path, fmt)) or os.path.exists(path)
\ No newline at end of file
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# ================= 技术图谱的二进制导出 =================
+# step8 的 CSV 每条边都重复保存 Source/Target 字符串和两端的 L1/L2，边数上百万时文件很大，test3 读取也很慢。
+# 这里把图拆成两张表：
+#   {name}_nodes.parquet  节点表，每个节点一行：id, leaf, L1, L2, L3 (id 即行号)
+#   {name}_edges.parquet  边表：src / dst = 节点 id (int32)，weight / direct / indirect (float32)，按权重降序
+# 也可以存成 .npz (不需要 pyarrow)。导出时可以只保留每个节点权重最高的前 N 条边，下游只读需要的边。
+
+GRAPH_SUFFIXES = (".parquet", ".npz")
+NODE_COLUMNS = ["leaf", "L1", "L2", "L3"]
+
+
+def graph_paths(path):
+    """D:\\x\\2021_External_Tech_Graph.parquet -> (..._nodes.parquet, ..._edges.parquet)"""
+    base, suffix = os.path.splitext(path)
+    if suffix.lower() not in GRAPH_SUFFIXES:
+        raise ValueError(f"不支持的图谱格式: {suffix} (可选 {', '.join(GRAPH_SUFFIXES)})")
+    return f"{base}_nodes{suffix}", f"{base}_edges{suffix}"
+
+
+def top_n_mask(src, dst, n_nodes, top_n):
+    """
+    边已按权重降序排列。对每个节点，只看与它相连的前 top_n 条边；
+    一条边只要在任意一端的前 top_n 里就保留。
+    """
+    ends = np.concatenate([src, dst]).astype(np.int64)
+    # 先按节点、再按边的位置排序：同一节点内仍是权重降序
+    order = np.lexsort((np.tile(np.arange(len(src)), 2), ends))
+    counts = np.bincount(ends, minlength=n_nodes)
+    starts = np.cumsum(counts) - counts
+    rank = np.empty(len(ends), dtype=np.int64)
+    rank[order] = np.arange(len(ends)) - starts[ends[order]]
+    keep = rank < top_n
+    return keep[:len(src)] | keep[len(src):]
+
+
+def _save(path, columns, top_n=None):
+    if path.lower().endswith(".npz"):
+        extra = {} if top_n is None else {"top_n": np.array(top_n)}
+        np.savez(path, **columns, **extra)
+    else:
+        df = pd.DataFrame(columns)
+        if top_n is not None:
+            df.attrs["top_n"] = top_n
+        df.to_parquet(path, index=False)
+
+
+def write_graph(path, nodes, edges, top_n=None):
+    """
+    nodes: leaf / L1 / L2 / L3 列 (每个叶子名一行)；
+    edges: Source / Target / Weight / Direct_Score / Indirect_Score 列 (step8 的边表)。
+    top_n 为每个节点保留的边数，None 为不裁剪。返回 (节点文件, 边文件)
+    """
+    node_path, edge_path = graph_paths(path)
+    leaves = nodes["leaf"]
+    # 直接用列本身查找 (Arrow 字符串列不必先转成 Python 对象)
+    leaf_index = pd.Index(leaves)
+    src = leaf_index.get_indexer(edges["Source"]).astype(np.int32)
+    dst = leaf_index.get_indexer(edges["Target"]).astype(np.int32)
+    if len(src) and min(src.min(), dst.min()) < 0:
+        raise ValueError("边表中有节点表里不存在的技术")
+    weight = edges["Weight"].to_numpy(dtype=np.float64)
+    direct = edges["Direct_Score"].to_numpy(dtype=np.float64)
+    indirect = edges["Indirect_Score"].to_numpy(dtype=np.float64)
+
+    order = np.argsort(-weight, kind="stable")
+    if top_n is not None:
+        order = order[top_n_mask(src[order], dst[order], len(leaves), top_n)]
+
+    _save(node_path, {"id": np.arange(len(leaves), dtype=np.int32),
+                      **{col: nodes[col].to_numpy(dtype=object).astype(str) for col in NODE_COLUMNS}})
+    _save(edge_path, {"src": src[order], "dst": dst[order], "weight": weight[order].astype(np.float32),
+                      "direct": direct[order].astype(np.float32), "indirect": indirect[order].astype(np.float32)},
+          top_n)
+    pruned = f"，每个节点保留前 {top_n} 条 (共 {len(edges)} 条)" if top_n is not None else ""
+    print(f"💾 图谱已导出: {os.path.basename(node_path)} ({len(leaves)} 个节点)，"
+          f"{os.path.basename(edge_path)} ({len(order)} 条边{pruned})")
+    return node_path, edge_path
+
+
+def _load(path):
+    if path.lower().endswith(".npz"):
+        with np.load(path) as data:
+            columns = {key: data[key] for key in data.files if key != "top_n"}
+            top_n = int(data["top_n"]) if "top_n" in data.files else None
+        df = pd.DataFrame(columns)
+        df.attrs["top_n"] = top_n
+        return df
+    return pd.read_parquet(path)
+
+
+def load_graph(path):
+    """返回 (节点表, 边表)；边表的 attrs["top_n"] 为导出时的裁剪参数 (None 为完整图)"""
+    node_path, edge_path = graph_paths(path)
+    nodes = _load(node_path)
+    edges = _load(edge_path)
+    edges.attrs.setdefault("top_n", None)
+    return nodes, edges
+
+
+def edge_list(nodes, edges):
+    """换回与 step8 CSV 相同的列 (Source / Target 为叶子名，分数还原为两位小数)"""
+    leaves = nodes["leaf"].to_numpy(dtype=object)
+    return pd.DataFrame({
+        "Source": leaves[edges["src"].to_numpy()],
+        "Target": leaves[edges["dst"].to_numpy()],
+        "Weight": edges["weight"].to_numpy(dtype=np.float64).round(2),
+        "Direct_Score": edges["direct"].to_numpy(dtype=np.float64).round(2),
+        "Indirect_Score": edges["indirect"].to_numpy(dtype=np.float64).round(2),
+    })
\ No newline at end of file
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+
+# ================= 外部标签向量缓存 =================
+# 外部标签库 (lables.txt) 很少变化，但原来每次运行都要加载整个 bge 模型重新编码。
+# 这里把外部标签向量保存为一个文件，键由两部分组成：
+#   - 标签文件内容的哈希
+#   - 模型指纹：模型目录里配置/分词文件的内容 + 权重文件的名称/大小/修改时间，再加上池化配置
+# 两者都没变时直接读取，完全不需要加载模型。
+
+# 外部标签统一用 CLS 池化、max_seq_length=512、归一化编码，step4 与 step5 共用同一份缓存
+DEFAULT_POOLING = "cls|max_seq_length=512|normalize"
+
+# 模型目录中只取元信息 (大小/修改时间) 的大文件
+_WEIGHT_SUFFIXES = (".bin", ".safetensors", ".pt", ".pth", ".h5", ".onnx", ".msgpack")
+
+
+def file_digest(path, chunk_bytes=1024 * 1024):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def model_fingerprint(model_path, pooling=DEFAULT_POOLING):
+    """
+    模型指纹：配置/分词文件按内容哈希，权重文件按 (名称, 大小, 修改时间)，避免每次读几百 MB 的权重。
+    model_path 不是本地目录时 (例如模型名称) 只用路径字符串本身。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pooling.encode('utf-8'))
+    if not os.path.isdir(model_path):
+        h.update(str(model_path).encode('utf-8'))
+        return h.hexdigest()
+
+    for root, dirs, files in os.walk(model_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, model_path).replace(os.sep, "/")
+            h.update(rel.encode('utf-8') + b"\0")
+            if name.lower().endswith(_WEIGHT_SUFFIXES):
+                st = os.stat(path)
+                h.update(f"{st.st_size}:{st.st_mtime_ns}".encode('utf-8'))
+            else:
+                h.update(file_digest(path).encode('utf-8'))
+    return h.hexdigest()
+
+
+def label_cache_path(cache_dir, label_path, model_path, pooling=DEFAULT_POOLING):
+    key = hashlib.blake2b(
+        f"{file_digest(label_path)}\0{model_fingerprint(model_path, pooling)}".encode('utf-8'), digest_size=16
+    ).hexdigest()
+    return os.path.join(cache_dir, f"external_embeddings_{key}.npy")
+
+
+def load_or_encode_labels(labels, label_path, model_path, encode_fn, cache_dir, pooling=DEFAULT_POOLING):
+    """
+    返回与 labels 一一对应的外部标签向量。
+    缓存有效时直接读取；否则调用 encode_fn(labels) 计算 (此时才需要加载模型) 并保存。
+    """
+    cache_path = label_cache_path(cache_dir, label_path, model_path, pooling)
+    if os.path.exists(cache_path):
+        ext_emb = np.load(cache_path)
+        if len(ext_emb) == len(labels):
+            print(f"💾 外部标签向量缓存命中: {cache_path}")
+            return ext_emb
+        print("⚠️ 外部标签向量缓存与标签数量不一致，重新计算")
+
+    print(f"🏷️  外部标签向量缓存未命中，开始计算 {len(labels)} 个标签...")
+    start_t = time.time()
+    ext_emb = np.asarray(encode_fn(labels), dtype=np.float32)
+    print(f"✅ 外部标签向量计算完成，耗时 {time.time() - start_t:.1f}s")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + ".tmp.npy"
+    np.save(tmp_path, ext_emb)
+    os.replace(tmp_path, cache_path)
+    print(f"💾 外部标签向量已缓存: {cache_path}")
+    return ext_emb
\ No newline at end of file
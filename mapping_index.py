@@ -0,0 +1,166 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from frame_store import read_frame, frame_exists, intermediate_path
+from label_cache import file_digest
+
+# ================= 映射表反查索引 =================
+# step6 (反查字典) 和 step8 (间接共现) 原来都要 iterrows 遍历 label_mapping_result.xlsx 的三组 (外部标签, 相似度)。
+# 这里把映射表一次性展开成长表 (每行一个 内部标签 × 外部标签)，
+# 再用 groupby idxmax 选出每个外部叶子名得分最高的内部标签 (同分时先出现的优先，与原来逐行比较一致)。
+# 结果保存在映射表旁边的 *_index.npz 里，并记录映射表文件的哈希；映射表没变时直接读取，不再读 xlsx。
+
+# 展开规则或叶子名规则改变时加 1，旧的索引文件会自动重建
+INDEX_VERSION = 1
+TOP_K = 3
+
+
+def get_leaf_name(text):
+    """
+    【仅用于匹配键】提取标签的最后一段
+    用于把 '先进制造-增材制造' 和 '增材制造技术' 统一起来进行匹配
+    """
+    if pd.isna(text) or str(text).strip() == "":
+        return ""
+    text = str(text).replace('root > ', '').replace(' > ', '-').replace('>', '-').replace('_', '-').replace('—', '-')
+    parts = text.split('-')
+    return parts[-1].strip()
+
+
+def mapping_index_path(mapping_file):
+    """D:\\x\\label_mapping_result.xlsx -> D:\\x\\label_mapping_result_index.npz"""
+    return os.path.splitext(mapping_file)[0] + "_index.npz"
+
+
+def source_candidates(mapping_file):
+    """read_mapping_table 可能读取的文件 (不论是否存在)：列式中间文件、xlsx、同名 CSV"""
+    return list(dict.fromkeys([intermediate_path(mapping_file), mapping_file, mapping_file.replace(".xlsx", ".csv")]))
+
+
+def _source_files(mapping_file):
+    return [p for p in source_candidates(mapping_file) if os.path.exists(p)]
+
+
+def mapping_digest(mapping_file):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"v{INDEX_VERSION}".encode('utf-8'))
+    for path in _source_files(mapping_file):
+        h.update(os.path.basename(path).encode('utf-8') + b"\0" + file_digest(path).encode('utf-8'))
+    return h.hexdigest()
+
+
+def read_mapping_table(mapping_file):
+    """优先读取映射表旁边的列式中间文件，其次 xlsx，最后同名 CSV"""
+    if frame_exists(mapping_file):
+        return read_frame(mapping_file).fillna("")
+    return read_frame(mapping_file.replace(".xlsx", ".csv")).fillna("")
+
+
+class MappingIndex:
+    def __init__(self, row, rank, internal, external, score, key, best, digest=""):
+        """
+        长表，按 (映射表行号, 排名) 排序，只保留外部标签非空的格子：
+        row / rank : 映射表中的行号和排名 (1~3)
+        internal   : 内部标签 (str 后的原值)
+        external   : 外部标签 (str 后的原值)
+        score      : 相似度，无法解析时为 0.0；映射表没有对应的相似度列时为 NaN
+        key        : 外部标签的叶子名 (step6 的反查键)
+        best       : 是否是该叶子名得分最高的一行
+        """
+        self.row = row
+        self.rank = rank
+        self.internal = internal
+        self.external = external
+        self.score = score
+        self.key = key
+        self.best = best
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.row)
+
+    @classmethod
+    def build(cls, map_df, digest=""):
+        ranks = [i for i in range(1, TOP_K + 1) if f"匹配外部标签_{i}" in map_df]
+        df = map_df.reset_index(drop=True)
+        n_rows = len(df)
+
+        # 按行展开 (row 0 的 1、2、3，row 1 的 1、2、3 ...)，顺序即原来逐行遍历时"先出现"的顺序
+        external = df[[f"匹配外部标签_{i}" for i in ranks]].to_numpy(dtype=object).ravel()
+        raw_score = df.reindex(columns=[f"相似度_{i}" for i in ranks]).to_numpy(dtype=object).ravel()
+        has_score = np.tile(np.array([f"相似度_{i}" in df for i in ranks], dtype=bool), n_rows)
+        long_df = pd.DataFrame({
+            "row": np.repeat(np.arange(n_rows, dtype=np.int32), len(ranks)),
+            "rank": np.tile(np.array(ranks, dtype=np.int8), n_rows),
+            "internal": np.repeat(df["内部标签"].astype(str).to_numpy(dtype=object), len(ranks)),
+            "external": pd.Series(external, dtype=object).astype(str),
+            # 与 float() 解析失败记 0.0 一致；没有相似度列的格子保持 NaN，不参与反查
+            "score": pd.to_numeric(pd.Series(raw_score, dtype=object), errors="coerce").fillna(0.0).where(has_score),
+        })
+        long_df = long_df[long_df["external"] != ""].reset_index(drop=True)
+
+        # 叶子名：每个不同的外部标签只算一次
+        codes, uniques = pd.factorize(long_df["external"])
+        long_df["key"] = np.array([get_leaf_name(v) for v in uniques] + [""], dtype=object)[codes]
+
+        # 每个叶子名取得分最高的一行；idxmax 在同分时返回最先出现的一行
+        candidates = long_df[(long_df["key"] != "") & long_df["score"].notna()]
+        best = np.zeros(len(long_df), dtype=bool)
+        if len(candidates):
+            best[candidates.groupby("key", sort=False)["score"].idxmax().to_numpy()] = True
+
+        return cls(long_df["row"].to_numpy(), long_df["rank"].to_numpy(),
+                   long_df["internal"].to_numpy(dtype=str), long_df["external"].to_numpy(dtype=str),
+                   long_df["score"].to_numpy(dtype=np.float64), long_df["key"].to_numpy(dtype=str), best, digest)
+
+    def save(self, path):
+        np.savez(path, version=np.array(INDEX_VERSION), digest=np.array(self.digest),
+                 row=self.row, rank=self.rank, internal=self.internal, external=self.external,
+                 score=self.score, key=self.key, best=self.best)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                return None
+            return cls(data["row"], data["rank"], data["internal"], data["external"],
+                       data["score"], data["key"], data["best"], str(data["digest"]))
+
+    def best_match_dict(self):
+        """{ 外部叶子名: {"internal_full": 内部完整路径, "score": 相似度} } (step6 的反查字典)"""
+        best = np.flatnonzero(self.best)
+        return {key: {"internal_full": internal.strip(), "score": score}
+                for key, internal, score in zip(self.key[best].tolist(), self.internal[best].tolist(),
+                                                self.score[best].tolist())}
+
+    def iter_rows(self):
+        """按映射表顺序产出 (内部标签, [外部标签_1, 外部标签_2, ...])，跳过没有外部标签的行"""
+        if not len(self.row):
+            return
+        starts = np.flatnonzero(np.r_[True, self.row[1:] != self.row[:-1]])
+        ends = np.r_[starts[1:], len(self.row)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield str(self.internal[start]), self.external[start:end].tolist()
+
+
+def load_mapping_index(mapping_file, rebuild=False):
+    """映射表没变时直接读取 *_index.npz，否则读取映射表重新构建并保存"""
+    index_path = mapping_index_path(mapping_file)
+    digest = mapping_digest(mapping_file)
+    if os.path.exists(index_path) and not rebuild:
+        index = MappingIndex.load(index_path)
+        if index is not None and index.digest == digest:
+            print(f"💾 映射表索引命中: {index_path}")
+            return index
+        print("⚠️ 映射表已改变，重建索引")
+
+    index = MappingIndex.build(read_mapping_table(mapping_file), digest)
+    # 多个年份的 step6/step8 可能同时运行，各自写临时文件再替换
+    tmp_path = f"{index_path}.{os.getpid()}.tmp.npz"
+    index.save(tmp_path)
+    os.replace(tmp_path, index_path)
+    print(f"💾 映射表索引已保存: {index_path} ({len(index)} 条)")
+    return index
\ No newline at end of file
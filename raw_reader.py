@@ -0,0 +1,129 @@
+import json
+import mmap
+import os
+
+# ================= 原始 ### 分隔文件的共享读取器 =================
+# datacollection 与 step2 读取的是同一份年度原始文件，这里统一用内存映射读取：
+#   - iter_lines  : 逐行产出 bytes，行尾/空白处理与 open(..., 'r') + line.strip() 一致
+#   - pick_fields : 只切分到所需的最后一列，只解码需要的列，不为其它列生成字符串
+#   - parse_source_line : 金额/时间字典用的 (项目名称, 金额, 开始时间)，step2 与 datacollection 共用
+# 同一次扫描里对每行分别调用 pick_fields，就可以同时喂给金额/时间字典和分类树。
+# 这个模块只用标准库，step2 和 chunked_parse 的子进程导入它时不会带上 pandas。
+# step2 扫描时把金额/时间字典存到原始文件旁边 (xxx.project_data.json)，datacollection 直接读取，不再重新扫描。
+
+# str.strip() 会去掉的 ASCII 空白 (bytes.strip() 不含 \x1c-\x1f，需要显式列出)
+_ASCII_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+
+# 每次从映射中取出的块大小
+BLOCK_BYTES = 4 * 1024 * 1024
+
+
+def iter_lines(path, start=0, end=None):
+    """
+    内存映射读取 [start, end) 区间 (默认整个文件)，逐行产出去掉首尾空白的非空行 (bytes)。
+    与文本模式一样，\r\n、\r、\n 都视为行尾。
+    """
+    if os.path.getsize(path) == 0:
+        return
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if end is None:
+            end = len(mm)
+        pos = start
+        while pos < end:
+            # 一次取一大块、在 C 层按换行切分，块尾不完整的行留到下一块
+            block_end = min(pos + BLOCK_BYTES, end)
+            if block_end < end:
+                nl = mm.rfind(b'\n', pos, block_end)
+                if nl == -1:
+                    nl = mm.find(b'\n', block_end, end)
+                block_end = end if nl == -1 else nl + 1
+            block = mm[pos:block_end]
+            pos = block_end
+
+            lines = block.split(b'\n')
+            if b'\r' in block:
+                lines = [piece for line in lines for piece in line.split(b'\r')]
+            for line in lines:
+                line = line.strip(_ASCII_WHITESPACE)
+                if not line:
+                    continue
+                # 行首/行尾是多字节字符时，可能是全角空格等 Unicode 空白，退回到文本方式处理
+                if line[0] >= 0x80 or line[-1] >= 0x80:
+                    line = line.decode('utf-8').strip().encode('utf-8')
+                    if not line:
+                        continue
+                yield line
+
+
+def project_data_path(path):
+    """D:\\x\\2025.csv -> D:\\x\\2025.project_data.json"""
+    return os.path.splitext(path)[0] + ".project_data.json"
+
+
+def save_project_data(path, project_data_map, dirty_lines):
+    """保存 { 项目名称: (金额, 开始时间) } 和脏行数，返回文件路径"""
+    sidecar = project_data_path(path)
+    tmp_path = f"{sidecar}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"dirty_lines": dirty_lines, "projects": project_data_map}, f, ensure_ascii=False)
+    os.replace(tmp_path, sidecar)
+    return sidecar
+
+
+def load_project_data(path):
+    """金额/时间字典存在且不比原始文件旧时返回 (project_data_map, dirty_lines)，否则返回 None"""
+    sidecar = project_data_path(path)
+    if not os.path.exists(sidecar) or (
+            os.path.exists(path) and os.path.getmtime(sidecar) < os.path.getmtime(path)):
+        return None
+    with open(sidecar, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {name: tuple(values) for name, values in data["projects"].items()}, data["dirty_lines"]
+
+
+def pick_fields(line, sep, columns, min_fields):
+    """
+    等价于 line.decode().split(sep) 之后取 parts[i] for i in columns，
+    但只切分到所需的最后一列 (其后的内容不切分)，并且只解码 columns 中的列。
+    列数少于 min_fields 时返回 None (与原来 len(parts) < min_fields 的判断一致)。
+    """
+    last = max(max(columns), min_fields - 1)
+    parts = line.split(sep, last)
+    if len(parts) < min_fields:
+        return None
+    # 最后一段包含剩余的所有列，只保留第一个字段
+    if last in columns and len(parts) == last + 1:
+        parts[last] = parts[last].split(sep, 1)[0]
+    return [parts[i].decode('utf-8') for i in columns]
+
+
+def clean_text(text):
+    """清理函数：去除多余的引号和首尾空格"""
+    if not text:
+        return ""
+    # 替换掉 CSV 中常见的双引号 wrapper
+    clean = text.replace('"""', '').replace('"', '').strip()
+    return clean
+
+
+def parse_source_line(line):
+    """
+    解析一行源数据 (raw_reader.iter_lines 产出的 bytes)，返回 (项目名称, 金额, 开始时间)
+    格式严重错误或项目名称为空时返回 None，计为脏行
+    """
+    # 提取数据
+    # 第1列(索引0): 项目名称 (用于匹配)
+    # 第2列(索引1): 金额
+    # 第4列(索引3): 开始时间
+    # 简单的脏数据过滤：如果切分后少于4部分，说明该行格式严重错误
+    fields = pick_fields(line, b'###', (0, 1, 3), 4)
+    if fields is None:
+        return None
+
+    p_name = clean_text(fields[0])
+    # 只有项目名称不为空才存入
+    if not p_name:
+        return None
+    return p_name, clean_text(fields[1]), clean_text(fields[2])
\ No newline at end of file
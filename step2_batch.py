@@ -0,0 +1,133 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from step2_transcsvtojson import process_large_csv
+
+# ================= ⚙️ 配置 =================
+# 用法示例：
+#   python step2_batch.py "D:\predict\0.1\data\20*.csv" --workers 4
+#   python step2_batch.py D:\predict\0.1\data\2014.csv D:\predict\0.1\data\2015.csv
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+SUMMARY_FILE_NAME = "step2_timing_summary.json"
+
+
+# ================= 代码 =================
+
+def expand_inputs(patterns):
+    """展开通配符，去重并保持给定顺序 (同一个通配符内按文件名排序)"""
+    inputs = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matched:
+            print(f"⚠️ 没有匹配到任何文件: {pattern}")
+        for path in matched:
+            if path not in inputs:
+                inputs.append(path)
+    return inputs
+
+
+def tree_output_path(input_path):
+    """2014.csv -> 2014_tree.json (与输入放在同一目录)"""
+    base, _ = os.path.splitext(input_path)
+    return base + "_tree.json"
+
+
+def run_one(input_path, output_path, compact, flat_projects, project_data):
+    """在子进程里处理一个年份文件"""
+    indent = None if compact else 2
+    return process_large_csv(input_path, output_path, indent=indent, compact=compact, flat_projects=flat_projects,
+                             project_data=project_data)
+
+
+def run_years(inputs, workers=DEFAULT_WORKERS, summary_path=None, compact=False, flat_projects=True,
+              project_data=True):
+    """
+    用进程池并行处理多个年份，每个年份独立写出自己的 JSON。
+    某一年失败只记录到汇总里，不影响其它年份的结果。
+    """
+    workers = max(1, min(workers, len(inputs)))
+    print("=" * 50)
+    print(f"🚀 批量处理 {len(inputs)} 个文件 (并行进程数: {workers})")
+    print("=" * 50)
+
+    results = {}
+    start_time = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_one, path, tree_output_path(path), compact, flat_projects, project_data): path
+            for path in inputs
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                stats = None
+                error = f"{type(e).__name__}: {e}"
+            else:
+                error = None if stats else "读取失败，详见该文件的日志输出"
+
+            if stats:
+                results[path] = dict(stats, status="ok")
+                print(f"✅ {os.path.basename(path)}: {stats['rows']} 行, "
+                      f"{stats['total_seconds']:.1f}s, {stats['rows_per_sec']:.0f} 行/秒")
+            else:
+                results[path] = {"input": path, "status": "failed", "error": error}
+                print(f"❌ {os.path.basename(path)} 处理失败: {error}")
+
+    wall_seconds = time.time() - start_time
+    ok = [results[p] for p in inputs if results[p]["status"] == "ok"]
+    failed = [p for p in inputs if results[p]["status"] != "ok"]
+    total_rows = sum(r["rows"] for r in ok)
+
+    summary = {
+        "workers": workers,
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(sum(r["total_seconds"] for r in ok), 3),
+        "total_rows": total_rows,
+        "rows_per_sec": round(total_rows / max(wall_seconds, 1e-9), 1),
+        "succeeded": len(ok),
+        "failed": failed,
+        "files": [results[p] for p in inputs]
+    }
+
+    if summary_path is None:
+        summary_path = os.path.join(os.path.dirname(os.path.abspath(inputs[0])), SUMMARY_FILE_NAME)
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print("\n📊 汇总:")
+    print(f"   成功 {len(ok)} 个，失败 {len(failed)} 个")
+    print(f"   共 {total_rows} 行，墙钟耗时 {wall_seconds:.1f}s，整体 {summary['rows_per_sec']:.0f} 行/秒")
+    print(f"   计时汇总已保存至: {summary_path}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量把多个年份的原始 CSV 转换成技术树 JSON")
+    parser.add_argument("inputs", nargs="+", help="年份 CSV 文件路径或通配符")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="并行进程数上限")
+    parser.add_argument("--summary", default=None, help=f"计时汇总文件路径 (默认与第一个输入同目录的 {SUMMARY_FILE_NAME})")
+    parser.add_argument("--compact", action="store_true", help="输出紧凑 JSON (不缩进)")
+    parser.add_argument("--no-flat-projects", action="store_true", help="不生成扁平项目清单")
+    parser.add_argument("--no-project-data", action="store_true", help="不保存 datacollection 用的金额/时间字典")
+    args = parser.parse_args()
+
+    inputs = expand_inputs(args.inputs)
+    if not inputs:
+        print("❌ 没有可处理的文件")
+        return
+
+    run_years(inputs, workers=args.workers, summary_path=args.summary,
+              compact=args.compact, flat_projects=not args.no_flat_projects,
+              project_data=not args.no_project_data)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
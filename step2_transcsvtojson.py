@@ -1,107 +1,168 @@
-import json
 import os
 import time
 
+from raw_reader import iter_lines, pick_fields, parse_source_line, save_project_data
+from tree_io import write_tree_json, write_flat_projects, flat_projects_path
 
-def process_large_csv(input_path, output_path):
+
+def parse_line(line):
+    """
+    解析一行原始数据 (raw_reader.iter_lines 产出的 bytes)，返回 (项目名称, 分类层级列表)；坏行返回 None
+    原始数据格式："值"###"值"###...
+    """
+    # 只取第1列和第9列；简单的完整性检查，防止坏数据导致索引越界
+    # 根据之前的样例，分类在索引8，所以至少要有9列
+    fields = pick_fields(line, b'"###"', (0, 8), 9)
+    if fields is None:
+        return None
+
+    # 清理数据：处理首尾的引号
+    # 第1列：项目名称 (左边可能有引号)
+    project_name = fields[0].lstrip('"')
+
+    # 第9列：分类路径，例如 "先进制造--工艺--其他"
+    # 注意：如果下一列没有引号，这一列可能包含后续的 "###..." 残余，需要再切一次
+    category_raw = fields[1]
+    category_path = category_raw.split('"###')[0].strip('"')
+
+    # 如果分类为空，归类到"未分类"（可选）
+    if not category_path or category_path == r"\N":
+        category_path = "未分类"
+
+    return project_name, category_path.split('--')
+
+
+# ================= 树结构 =================
+# 构建期的节点不直接用输出格式 {"name","children":[...]}：
+# children 保存为 { 名称: 子节点 } 的字典索引，查找同级节点是 O(1) 而不是逐个扫描。
+# dict 保持插入顺序，所以转换回列表时子节点顺序与首次出现顺序一致。
+
+def new_node():
+    return {"children": {}, "projects": None}
+
+
+def add_project(root, categories, project_name):
+    """沿分类路径下沉（缺失的节点自动创建），把项目挂到叶子分类上"""
+    node = root
+    for category_name in categories:
+        children = node["children"]
+        child = children.get(category_name)
+        if child is None:
+            child = new_node()
+            children[category_name] = child
+        node = child
+
+    if node["projects"] is None:
+        node["projects"] = []
+    node["projects"].append(project_name)
+
+
+def to_output_tree(node, name="root"):
+    """把构建期的索引树转换为输出用的 {"name","children","projects"} 结构"""
+    out = {
+        "name": name,
+        "children": [to_output_tree(child, child_name) for child_name, child in node["children"].items()]
+    }
+    if node["projects"] is not None:
+        out["projects"] = node["projects"]
+    return out
+
+
+def process_large_csv(input_path, output_path, indent=2, compact=False, flat_projects=False, workers=1,
+                      project_data=False):
+    """
+    indent / compact : JSON 输出格式，见 tree_io.write_tree_json
+    flat_projects    : 同时写出扁平项目清单 (xxx_tree.projects.jsonl)，供下游逐行读取
+    workers          : 大于 1 时按字节区间切块、多进程并行解析 (见 chunked_parse)，输出与串行一致
+    project_data     : 同一次扫描顺便构建 datacollection 用的 { 项目名称: (金额, 开始时间) }，
+                       保存到源文件旁边 (xxx.project_data.json)，datacollection 不必再扫描一遍
+    返回本次运行的统计信息 dict；读取失败时返回 None
+    """
     print(f"开始处理文件: {input_path}")
 
     # 初始化根节点
-    root = {
-        "name": "root",
-        "children": []
-    }
+    root = new_node()
+    project_data_map = {} if project_data else None
 
     # 统计计数器
     line_count = 0
+    dirty_lines_count = 0
     start_time = time.time()
 
-    # 打开文件
-    # 注意：如果报错 UnicodeDecodeError，请将 encoding='utf-8' 改为 'gbk' 或 'gb18030'
+    # 注意：源文件按 UTF-8 解码，如果报错 UnicodeDecodeError，需要先把文件转成 UTF-8
     try:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
+        if workers > 1:
+            from chunked_parse import scan_raw_file
+            result = scan_raw_file(input_path, workers, build_project_map=project_data_map is not None)
+            root, line_count = result["root"], result["rows"]
+            if project_data_map is not None:
+                project_data_map.update(result["project_data_map"])
+                dirty_lines_count = result["dirty_lines"]
+        else:
+            # 内存映射逐行读取，只解码需要的列
+            for line in iter_lines(input_path):
+                # 0. 顺便收集金额/时间 (与 datacollection 同一次扫描)
+                if project_data_map is not None:
+                    record = parse_source_line(line)
+                    if record is None:
+                        dirty_lines_count += 1
+                    else:
+                        project_data_map[record[0]] = record[1:]
 
                 # 1. 解析行数据
-                # 原始数据格式："值"###"值"###...
-                parts = line.split('"###"')
-
-                # 简单的完整性检查，防止空行或坏数据导致索引越界
-                # 根据之前的样例，分类在索引8，所以至少要有9列
-                if len(parts) < 9:
+                parsed = parse_line(line)
+                if parsed is None:
                     continue
+                project_name, categories = parsed
 
-                # 清理数据：处理首尾的引号
-                # 第1列：项目名称 (parts[0] 左边可能有引号)
-                project_name = parts[0].lstrip('"')
-
-                # 第9列：分类路径 (parts[8])，例如 "先进制造--工艺--其他"
-                # 注意：parts[8] 可能包含后续的 "###..." 残余，因为我们split的时候可能没切干净末尾
-                # 但根据 split('"###"') 的逻辑，parts[8] 应该是纯净的，或者右边带引号
-                category_raw = parts[8]
-                category_path = category_raw.split('"###')[0].strip('"')
-
-                # 如果分类为空，归类到"未分类"（可选）
-                if not category_path or category_path == r"\N":
-                    category_path = "未分类"
-
-                categories = category_path.split('--')
-
-                # 2. 构建树结构
-                current_level_children = root["children"]
-
-                for index, category_name in enumerate(categories):
-                    # 在当前层级查找节点
-                    found_node = None
-                    for child in current_level_children:
-                        if child["name"] == category_name:
-                            found_node = child
-                            break
-
-                    # 如果没找到，创建新节点
-                    if not found_node:
-                        new_node = {
-                            "name": category_name,
-                            "children": []
-                        }
-                        current_level_children.append(new_node)
-                        found_node = new_node
-
-                    # 如果是叶子分类，添加项目
-                    if index == len(categories) - 1:
-                        if "projects" not in found_node:
-                            found_node["projects"] = []
-                        found_node["projects"].append(project_name)
-
-                    # 下沉到下一级
-                    current_level_children = found_node["children"]
+                # 2. 挂到树上
+                add_project(root, categories, project_name)
 
                 # 进度条
                 line_count += 1
                 if line_count % 10000 == 0:
-                    print(f"已处理 {line_count} 行... (耗时: {time.time() - start_time:.2f}s)")
+                    elapsed = time.time() - start_time
+                    print(f"已处理 {line_count} 行... (耗时: {elapsed:.2f}s, {line_count / max(elapsed, 1e-9):.0f} 行/秒)")
 
     except FileNotFoundError:
         print(f"错误：找不到文件 {input_path}")
         return
     except UnicodeDecodeError:
-        print("错误：文件编码读取失败。请尝试将代码中的 encoding='utf-8' 修改为 'gbk' 或 'gb18030'。")
+        print("错误：文件编码读取失败。请先把源文件转换为 UTF-8 编码 (例如从 gbk / gb18030 转换)。")
         return
     except Exception as e:
         print(f"发生未知错误: {e}")
         return
 
-    print(f"处理完成，共 {line_count} 行。正在写入 JSON 文件...")
+    parse_seconds = time.time() - start_time
+    print(f"处理完成，共 {line_count} 行，解析速度 {line_count / max(parse_seconds, 1e-9):.0f} 行/秒。正在写入 JSON 文件...")
 
-    # 写入结果
+    # 写入结果 (按子树流式写出，不再整体 json.dump)
     with open(output_path, 'w', encoding='utf-8') as f_out:
-        json.dump(root, f_out, ensure_ascii=False, indent=2)
+        write_tree_json(root, f_out, indent=indent, compact=compact)
 
     print(f"文件已保存至: {output_path}")
-    print(f"总耗时: {time.time() - start_time:.2f}s")
+
+    if project_data_map is not None:
+        sidecar_path = save_project_data(input_path, project_data_map, dirty_lines_count)
+        print(f"金额/时间字典已保存至: {sidecar_path} (有效项目 {len(project_data_map)} 个，"
+              f"忽略脏行/空名 {dirty_lines_count} 行)")
+
+    if flat_projects:
+        sidecar_path = flat_projects_path(output_path)
+        count = write_flat_projects(root, sidecar_path)
+        print(f"扁平项目清单已保存至: {sidecar_path} ({count} 条)")
+    total_seconds = time.time() - start_time
+    print(f"总耗时: {total_seconds:.2f}s")
+
+    return {
+        "input": input_path,
+        "output": output_path,
+        "rows": line_count,
+        "parse_seconds": round(parse_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "rows_per_sec": round(line_count / max(total_seconds, 1e-9), 1)
+    }
 
 
 if __name__ == "__main__":
@@ -110,4 +171,9 @@ if __name__ == "__main__":
     input_csv = r"D:\predict\0.1\data\2014.csv"
     output_json = r"D:\predict\0.1\data\2014_tree.json"
 
-    process_large_csv(input_csv, output_json)
\ No newline at end of file
+    # JSON 格式：indent=2 与旧版一致；indent=None 不缩进；compact=True 最紧凑
+    # flat_projects=True 额外生成 2014_tree.projects.jsonl，step4/step5 会优先读取它
+    # workers>1 时单个大文件切块多进程解析
+    # project_data=True 同时保存 datacollection 用的金额/时间字典 (2014.project_data.json)，省去一次扫描
+    process_large_csv(input_csv, output_json, indent=2, compact=False, flat_projects=True, workers=1,
+                      project_data=True)
\ No newline at end of file
@@ -2,6 +2,9 @@ import os
 import numpy as np
 import pandas as pd
 
+from frame_store import write_frame
+from ann_index import load_or_build_index, search_topk
+
 # ================= 配置路径 =================
 
 # 1. 上一步生成数据的文件夹
@@ -13,23 +16,27 @@ OUTPUT_EXCEL = r"D:\predict\data\合同信息\label_mapping_result.xlsx"
 # 3. 配置参数
 TOP_K = 3          # 每个内部标签匹配最相似的 3 个外部标签
 MIN_SCORE = 0.0    # 相似度阈值 (0~1)，低于这个分数的可以忽略，设为0表示保留所有结果
+TOPK_MAX_BYTES = 512 * 1024 ** 2  # 分块计算相似度时每块的内存上限
+# 匹配模式: "exact" 精确 Top-K / "ann" 使用外部向量旁边的 IVF 近似索引 (首次运行时自动构建)
+MATCH_MODE = "exact"
+ANN_NPROBE = 8  # 每个查询探测的倒排表个数，越大越准、越慢 (召回率可用 python ann_index.py 评估)
 
 # ================= 核心代码 =================
 
-def load_data():
+def load_data(data_dir=DATA_DIR):
     """加载向量和标签文件"""
-    print(f"📂 正在加载数据: {DATA_DIR}")
+    print(f"📂 正在加载数据: {data_dir}")
     
     try:
         # 加载向量
-        int_emb = np.load(os.path.join(DATA_DIR, "internal_embeddings.npy"))
-        ext_emb = np.load(os.path.join(DATA_DIR, "external_embeddings.npy"))
+        int_emb = np.load(os.path.join(data_dir, "internal_embeddings.npy"))
+        ext_emb = np.load(os.path.join(data_dir, "external_embeddings.npy"))
         
         # 加载标签文本
-        with open(os.path.join(DATA_DIR, "internal_labels_clean.txt"), 'r', encoding='utf-8') as f:
+        with open(os.path.join(data_dir, "internal_labels_clean.txt"), 'r', encoding='utf-8') as f:
             int_labels = [line.strip() for line in f]
             
-        with open(os.path.join(DATA_DIR, "external_labels_clean.txt"), 'r', encoding='utf-8') as f:
+        with open(os.path.join(data_dir, "external_labels_clean.txt"), 'r', encoding='utf-8') as f:
             ext_labels = [line.strip() for line in f]
             
         print(f"✅ 数据加载成功！")
@@ -41,36 +48,30 @@ def load_data():
         print(f"❌ 错误：找不到文件，请检查路径。详情: {e}")
         exit()
 
-def main():
+def main(data_dir=DATA_DIR, output_excel=OUTPUT_EXCEL):
     print("="*50)
     print("🚀 开始第 3 步：计算相似度矩阵并生成映射表")
     print("="*50)
 
     # 1. 加载数据
-    int_emb, ext_emb, int_labels, ext_labels = load_data()
-    
-    # 2. 计算相似度矩阵 (矩阵乘法，速度极快)
-    # 形状: (内部数量, 外部数量)
-    print("\n⚡ 正在计算相似度矩阵...")
-    similarity_matrix = np.dot(int_emb, ext_emb.T)
-    
-    # 3. 寻找 Top-K 匹配
-    print(f"🔍 正在为每个内部标签寻找 Top-{TOP_K} 匹配...")
+    int_emb, ext_emb, int_labels, ext_labels = load_data(data_dir)
     
+    # 2. 分块计算相似度并直接取 Top-K (不构建完整的相似度矩阵)
+    print(f"\n⚡ 正在为每个内部标签寻找 Top-{TOP_K} 匹配...")
+    index = None
+    if MATCH_MODE == "ann":
+        index, ext_emb = load_or_build_index(os.path.join(data_dir, "external_embeddings.npy"), ext_emb)
+    top_indices_all, top_scores_all = search_topk(int_emb, ext_emb, TOP_K, mode=MATCH_MODE, index=index,
+                                                  nprobe=ANN_NPROBE, max_bytes=TOPK_MAX_BYTES)
+
     results = []
-    
+
     for i, i_label in enumerate(int_labels):
-        # 获取第 i 个内部标签的所有相似度分数
-        scores = similarity_matrix[i]
-        
-        # 对分数排序，取前 Top_K 的索引 (argsort 返回的是从小到大的索引，所以要[::-1]反转)
-        top_indices = scores.argsort()[-TOP_K:][::-1]
-        
         # 构建一行数据
         row_data = {"内部标签": i_label}
         
-        for rank, idx in enumerate(top_indices):
-            score = float(scores[idx])
+        for rank, idx in enumerate(top_indices_all[i]):
+            score = float(top_scores_all[i, rank])
             matched_label = ext_labels[idx]
             
             if score >= MIN_SCORE:
@@ -83,7 +84,7 @@ def main():
         results.append(row_data)
 
     # 4. 导出到 Excel
-    print(f"\n💾 正在写入 Excel: {OUTPUT_EXCEL}")
+    print(f"\n💾 正在写入 Excel: {output_excel}")
     df = pd.DataFrame(results)
     
     # 调整列顺序，好看一点
@@ -92,9 +93,9 @@ def main():
         cols.extend([f"匹配外部标签_{k}", f"相似度_{k}"])
     df = df[cols]
     
-    df.to_excel(OUTPUT_EXCEL, index=False)
+    write_frame(df, output_excel)
     
-    print(f"🎉 成功！映射表已生成。\n请打开查看效果: {OUTPUT_EXCEL}")
+    print(f"🎉 成功！映射表已生成。\n请打开查看效果: {output_excel}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,9 +2,14 @@ import json
 import os
 import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, models
 import time
-import torch
+
+from tree_io import find_flat_projects, iter_flat_projects
+from embedding_store import EmbeddingStore
+from topk import topk_similarity, topk_columns
+from label_cache import load_or_encode_labels
+from frame_store import write_frame
+from encoding import load_bge_model, encode_fixed, encode_bucketed, encode_with_cpu_pool
 
 # ================= ⚙️ 配置 =================
 
@@ -16,25 +21,70 @@ LOCAL_MODEL_PATH = r"D:\predict\models\bge-large-zh-v1.5"
 OUTPUT_EXCEL = r"D:\predict\0.1\2015_Project_Final_Labels_GPU.xlsx"
 OUTPUT_CSV = r"D:\predict\0.1\2015_Project_Final_Labels_GPU.csv"
 
-# 中间缓存文件（防止崩了白跑）
+# 跨年份共享的增量向量缓存 (按 模型+池化配置+文本 去重，只计算没见过的项目)
+EMB_STORE_PATH = r"D:\predict\0.1\embedding_store.sqlite"
+EMB_STORE_MAX_BYTES = 4 * 1024 ** 3
+POOLING_CONFIG = "cls|max_seq_length=512|normalize"
+
+# 外部标签向量缓存目录 (按 标签文件哈希 + 模型指纹 命名，命中时不加载模型)
+LABEL_CACHE_DIR = r"D:\predict\0.1\label_cache"
+
+# 本年份的项目向量 (按项目顺序导出一份，step5 直接读取)
 CACHE_EMB_PATH = r"D:\predict\0.1\2015project_embeddings_cache.npy"
 
 BATCH_SIZE = 64
+TOPK_MAX_BYTES = 512 * 1024 ** 2  # 分块计算相似度时每块的内存上限
+
+# 项目向量的编码方式：
+#   "fixed"    : 固定 BATCH_SIZE、max_seq_length=512 (原来的方式)
+#   "bucketed" : 按 token 长度排序分桶，每批按 TOKEN_BUDGET 控制大小并只补齐到本批最长长度 (CPU 上明显更快)
+#   "cpu_pool" : 无 GPU 的多核服务器上用多个进程分片编码 (进程内仍按 bucketed 方式)，每个分片算完立即写入向量缓存
+ENCODE_MODE = "bucketed"
+TOKEN_BUDGET = 8192
+CPU_POOL_WORKERS = 4          # 进程数
+CPU_POOL_TORCH_THREADS = None  # 每个进程的 torch 线程数，None 表示 CPU 核数 / 进程数
+CPU_POOL_SHARD_SIZE = 2000     # 每个分片的条数
+# 截断长度取长度分布的这个分位数；1.0 表示不截断任何文本 (结果与 fixed 一致)，
+# 小于 1.0 时超长的少数文本会被截断，向量会有差异，因此也计入缓存键
+SEQ_LEN_QUANTILE = 1.0
+if SEQ_LEN_QUANTILE < 1.0:
+    POOLING_CONFIG += f"|seq_len_quantile={SEQ_LEN_QUANTILE}"
 
 
 # ================= 代码 =================
 
-def load_model_on_gpu(model_path):
-    print(f"\n⬇️  正在加载模型: {model_path}")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"🖥️  运行设备: {device}")
+def encode_projects_in_pool(texts, save, model_path=LOCAL_MODEL_PATH):
+    return encode_with_cpu_pool(model_path, texts, workers=CPU_POOL_WORKERS, torch_threads=CPU_POOL_TORCH_THREADS,
+                                shard_size=CPU_POOL_SHARD_SIZE, token_budget=TOKEN_BUDGET, quantile=SEQ_LEN_QUANTILE,
+                                on_shard_done=save)
+
+
+_models = {}
+
+
+def get_model(model_path=LOCAL_MODEL_PATH):
+    """首次需要编码时才加载模型；项目和外部标签都命中缓存时整个运行都不加载"""
+    if model_path not in _models:
+        _models[model_path] = load_bge_model(model_path)
+    return _models[model_path]
+
+
+def encode_external_labels(labels, model_path=LOCAL_MODEL_PATH):
+    return get_model(model_path).encode(labels, normalize_embeddings=True, batch_size=BATCH_SIZE, show_progress_bar=False)
 
-    word_embedding_model = models.Transformer(model_path, max_seq_length=512)
-    pooling_model = models.Pooling(word_embedding_model.get_word_embedding_dimension(), pooling_mode_cls_token=True)
-    return SentenceTransformer(modules=[word_embedding_model, pooling_model], device=device)
+
+def encode_projects(model, texts):
+    if ENCODE_MODE == "bucketed":
+        return encode_bucketed(model, texts, token_budget=TOKEN_BUDGET, quantile=SEQ_LEN_QUANTILE)
+    return encode_fixed(model, texts, batch_size=BATCH_SIZE)
 
 
 def extract_projects(file_path):
+    flat_path = find_flat_projects(file_path)
+    if flat_path:
+        print(f"📂 读取扁平项目清单: {flat_path}")
+        return pd.DataFrame([{"项目名称": p, "原内部路径": path} for p, path in iter_flat_projects(flat_path) if p])
+
     print(f"📂 读取 JSON: {file_path}")
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -59,79 +109,63 @@ def extract_projects(file_path):
 
 
 def load_external_labels(file_path):
+    """返回 (实际文件路径, 标签列表)"""
     if not os.path.exists(file_path): file_path += ".txt"
     with open(file_path, 'r', encoding='utf-8') as f:
-        return [line.strip() for line in f if line.strip()]
+        return file_path, [line.strip() for line in f if line.strip()]
 
 
-def main():
+def main(json_file_path=JSON_FILE_PATH, external_txt_path=EXTERNAL_TXT_PATH,
+         local_model_path=LOCAL_MODEL_PATH, output_excel=OUTPUT_EXCEL, output_csv=OUTPUT_CSV,
+         emb_store_path=EMB_STORE_PATH, label_cache_dir=LABEL_CACHE_DIR, cache_emb_path=CACHE_EMB_PATH):
     print("=" * 50)
     print("🚀 最终防崩溃版启动")
     print("=" * 50)
 
     # 1. 加载数据
-    df = extract_projects(JSON_FILE_PATH)
+    df = extract_projects(json_file_path)
     project_names = df["项目名称"].tolist()
     print(f"📊 共 {len(project_names)} 条项目")
 
-    # 2. 检查是否有缓存向量
-    if os.path.exists(CACHE_EMB_PATH):
-        print(f"\n⚡ 发现已计算好的向量缓存: {CACHE_EMB_PATH}")
-        print("⏩ 直接加载缓存，跳过模型计算！")
-        proj_emb = np.load(CACHE_EMB_PATH)
-        if len(proj_emb) != len(project_names):
-            print("❌ 缓存数量与数据不一致，将重新计算...")
-            need_calc = True
+    # 2. 计算项目向量：只计算缓存库里没有的项目 (模型在第一次需要时才加载)
+    print(f"\n⚡ 开始计算项目向量 (增量缓存: {emb_store_path})...")
+    start_t = time.time()
+    with EmbeddingStore(emb_store_path, local_model_path, pooling=POOLING_CONFIG, max_bytes=EMB_STORE_MAX_BYTES) as store:
+        if ENCODE_MODE == "cpu_pool":
+            proj_emb = store.encode(project_names, lambda texts, save: encode_projects_in_pool(texts, save, local_model_path),
+                                    stream=True)
         else:
-            need_calc = False
-            # 还是需要加载模型来算一下外部标签的向量
-            model = load_model_on_gpu(LOCAL_MODEL_PATH)
-    else:
-        need_calc = True
-        model = load_model_on_gpu(LOCAL_MODEL_PATH)
-
-    # 3. 计算项目向量 (如果没缓存)
-    if need_calc:
-        print(f"\n⚡ 开始计算项目向量...")
-        start_t = time.time()
-        proj_emb = model.encode(project_names, normalize_embeddings=True, batch_size=BATCH_SIZE, show_progress_bar=True)
-        print(f"✅ 计算耗时: {time.time() - start_t:.1f}s")
-
-        # 【关键】立即保存缓存
-        print(f"💾 保存向量缓存到: {CACHE_EMB_PATH}")
-        np.save(CACHE_EMB_PATH, proj_emb)
-
-    # 4. 计算外部标签向量
-    print("\n🏷️  计算外部标签向量...")
-    ext_labels = load_external_labels(EXTERNAL_TXT_PATH)
-    ext_emb = model.encode(ext_labels, normalize_embeddings=True, batch_size=BATCH_SIZE, show_progress_bar=False)
-
-    # 5. 匹配
-    print("\n🔍 正在匹配...")
-    sim_matrix = np.dot(proj_emb, ext_emb.T)
+            proj_emb = store.encode(project_names, lambda texts: encode_projects(get_model(local_model_path), texts))
+    print(f"✅ 计算耗时: {time.time() - start_t:.1f}s")
+
+    # 按本年份的项目顺序导出一份，供 step5 使用
+    print(f"💾 保存向量缓存到: {cache_emb_path}")
+    np.save(cache_emb_path, proj_emb)
+
+    # 3. 外部标签向量 (标签文件和模型都没变时直接读取缓存)
+    print("\n🏷️  加载外部标签向量...")
+    label_path, ext_labels = load_external_labels(external_txt_path)
+    ext_emb = load_or_encode_labels(ext_labels, label_path, local_model_path,
+                                    lambda labels: encode_external_labels(labels, local_model_path), label_cache_dir)
 
-    results = []
+    # 4. 匹配
+    print("\n🔍 正在匹配...")
     top_k = 3
-    for i, row in df.iterrows():
-        scores = sim_matrix[i]
-        top_idx = scores.argsort()[-top_k:][::-1]
-        item = row.to_dict()
-        for rank, idx in enumerate(top_idx):
-            item[f"外部标签_{rank + 1}"] = ext_labels[idx]
-            item[f"相似度_{rank + 1}"] = round(float(scores[idx]), 4)
-        results.append(item)
-
-    # 6. 保存结果 (双重保险)
-    df_res = pd.DataFrame(results)
-
-    # 优先保存 CSV (速度快，不依赖 openpyxl)
-    print(f"\n💾 正在保存 CSV: {OUTPUT_CSV}")
-    df_res.to_csv(OUTPUT_CSV, index=False, encoding='utf-8-sig')  # utf-8-sig 防止中文乱码
+    top_idx_all, top_scores_all = topk_similarity(proj_emb, ext_emb, top_k, max_bytes=TOPK_MAX_BYTES)
+
+    # 直接用下标数组从标签数组里取值拼成结果列
+    df_res = df.reset_index(drop=True).assign(**topk_columns(ext_labels, top_idx_all, top_scores_all))
+
+    # 5. 保存结果 (双重保险)
+
+    # 优先保存 CSV (速度快，不依赖 openpyxl)，同时写一份列式中间文件供下游读取
+    print(f"\n💾 正在保存 CSV: {output_csv}")
+    write_frame(df_res, output_csv)  # utf-8-sig 防止中文乱码
 
     # 尝试保存 Excel
     try:
-        print(f"💾 正在保存 Excel: {OUTPUT_EXCEL}")
-        df_res.to_excel(OUTPUT_EXCEL, index=False)
+        print(f"💾 正在保存 Excel: {output_excel}")
+        df_res.to_excel(output_excel, index=False)
         print("✅ Excel 保存成功")
     except ImportError:
         print("⚠️ 缺少 openpyxl 库，Excel 保存失败，但 CSV 已保存成功！")
@@ -2,9 +2,13 @@ import json
 import os
 import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, models  # <--- 注意这里引入了 models
 import time
 
+from tree_io import find_flat_projects, iter_flat_projects
+from ann_index import load_or_build_index, search_topk
+from topk import topk_columns
+from embedding_store import encode_deduplicated
+
 # ================= 配置路径 =================
 
 # 1. 输入：你的 JSON 技术树文件
@@ -21,6 +25,10 @@ OUTPUT_EXCEL = r"D:\predict\0.1\2024_Project_Final_Labels.xlsx"
 
 # 5. 参数
 TOP_K = 3  # 每个项目匹配前3个外部标签
+TOPK_MAX_BYTES = 512 * 1024 ** 2  # 分块计算相似度时每块的内存上限
+# 匹配模式: "exact" 精确 Top-K / "ann" 使用外部向量旁边的 IVF 近似索引 (首次运行时自动构建)
+MATCH_MODE = "exact"
+ANN_NPROBE = 8  # 每个查询探测的倒排表个数，越大越准、越慢 (召回率可用 python ann_index.py 评估)
 
 # ================= 核心代码 =================
 
@@ -37,7 +45,15 @@ def load_external_data():
         exit()
 
 def extract_projects_from_json(file_path):
-    """递归解析JSON树，提取所有项目及其路径"""
+    """递归解析JSON树，提取所有项目及其路径（有扁平项目清单时直接逐行读取）"""
+    flat_path = find_flat_projects(file_path)
+    if flat_path:
+        print(f"📂 正在读取扁平项目清单: {flat_path}")
+        project_list = [{"项目名称": proj, "原内部路径": path}
+                        for proj, path in iter_flat_projects(flat_path) if proj and isinstance(proj, str)]
+        print(f"✅ 清单读取完成，共提取到 {len(project_list)} 个项目")
+        return project_list
+
     print(f"📂 正在读取 JSON: {file_path}")
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -75,6 +91,9 @@ def load_model_manually(model_path):
     """
     print(f"\n⬇️  正在手动组装 BGE 模型: {model_path}")
     try:
+        # 需要编码时才导入 (torch / sentence_transformers 导入很慢)
+        from sentence_transformers import SentenceTransformer, models
+
         # 1. 加载基础 Transformer 模型 (只读取 config.json 和 pytorch_model.bin)
         word_embedding_model = models.Transformer(model_path, max_seq_length=512)
         
@@ -118,37 +137,28 @@ def main():
     
     print(f"⚡ 正在计算 {len(project_names)} 个项目的向量...")
     start_time = time.time()
-    project_embeddings = model.encode(project_names, normalize_embeddings=True, show_progress_bar=True)
+    # 同名项目只编码一次，再按下标散回到每一行
+    project_embeddings = encode_deduplicated(
+        project_names, lambda texts: model.encode(texts, normalize_embeddings=True, show_progress_bar=True)
+    )
     print(f"✅ 计算完成，耗时: {time.time() - start_time:.2f} 秒")
 
     # 4. 核心匹配
     print("\n🔍 正在进行语义匹配...")
-    similarity_matrix = np.dot(project_embeddings, ext_emb.T)
+    index = None
+    if MATCH_MODE == "ann":
+        index, ext_emb = load_or_build_index(os.path.join(EMBEDDING_DIR, "external_embeddings.npy"), ext_emb)
+    top_indices_all, top_scores_all = search_topk(project_embeddings, ext_emb, TOP_K, mode=MATCH_MODE, index=index,
+                                                  nprobe=ANN_NPROBE, max_bytes=TOPK_MAX_BYTES)
 
     # 5. 整理结果
-    final_results = []
-    
-    for i, row in df_projects.iterrows():
-        proj_name = row["项目名称"]
-        path_info = row["原内部路径"]
-        
-        scores = similarity_matrix[i]
-        top_indices = scores.argsort()[-TOP_K:][::-1]
-        
-        res_item = {
-            "项目名称": proj_name,
-            "原内部路径": path_info
-        }
-        
-        for rank, idx in enumerate(top_indices):
-            res_item[f"外部标签_{rank+1}"] = ext_labels[idx]
-            res_item[f"相似度_{rank+1}"] = round(float(scores[idx]), 4)
-            
-        final_results.append(res_item)
+    # 直接用下标数组从标签数组里取值拼成结果列
+    df_final = df_projects[["项目名称", "原内部路径"]].reset_index(drop=True).assign(
+        **topk_columns(ext_labels, top_indices_all, top_scores_all)
+    )
 
     # 6. 保存 Excel
     print(f"\n💾 正在保存最终结果到: {OUTPUT_EXCEL}")
-    df_final = pd.DataFrame(final_results)
     df_final.to_excel(OUTPUT_EXCEL, index=False)
     
     print(f"🎉 全部完成！请查看结果文件：{OUTPUT_EXCEL}")
@@ -2,11 +2,15 @@ import json
 import os
 import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, models
 import time
-import torch
 import re
 
+from topk import topk_similarity, topk_columns
+from tree_io import find_flat_projects, iter_flat_projects
+from label_cache import load_or_encode_labels
+from frame_store import write_frame
+from encoding import load_bge_model
+
 # ================= ⚙️ 配置路径 =================
 
 JSON_FILE_PATH = r"D:\predict\0.1\data\2021_tree.json"
@@ -16,22 +20,31 @@ LOCAL_MODEL_PATH = r"D:\predict\models\bge-large-zh-v1.5"
 # 缓存的向量文件 (必须存在)
 CACHE_EMB_PATH = r"D:\predict\0.1\2021project_embeddings_cache.npy"
 
+# 外部标签向量缓存目录 (与 step4 共用，命中时不加载模型)
+LABEL_CACHE_DIR = r"D:\predict\0.1\label_cache"
+
+# 分块计算相似度时每块的内存上限
+TOPK_MAX_BYTES = 512 * 1024 ** 2
+
 # 最终修复结果
 OUTPUT_CSV_FIXED = r"D:\predict\data\合同信息\2021_Project_Final_Fixed.csv"
 
 
 # ================= 代码 =================
 
-def load_model_for_external(model_path):
-    """只用来算外部标签，很快"""
-    print(f"⬇️  加载模型(仅计算外部标签): {model_path}")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    word_embedding_model = models.Transformer(model_path, max_seq_length=512)
-    pooling_model = models.Pooling(word_embedding_model.get_word_embedding_dimension(), pooling_mode_cls_token=True)
-    return SentenceTransformer(modules=[word_embedding_model, pooling_model], device=device)
+def encode_external_labels(labels, model_path=LOCAL_MODEL_PATH):
+    """只有外部标签缓存未命中时才会调用，此时才加载模型"""
+    print("⬇️  加载模型(仅计算外部标签)")
+    model = load_bge_model(model_path)
+    return model.encode(labels, normalize_embeddings=True, show_progress_bar=False)
 
 
 def extract_projects(file_path):
+    flat_path = find_flat_projects(file_path)
+    if flat_path:
+        print(f"📂 读取扁平项目清单: {flat_path}")
+        return pd.DataFrame([{"项目名称": p, "原内部路径": path} for p, path in iter_flat_projects(flat_path) if p])
+
     print(f"📂 再次读取 JSON (确保顺序一致): {file_path}")
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -55,16 +68,68 @@ def extract_projects(file_path):
     return pd.DataFrame(projects)
 
 
+# Excel 非法控制字符 (预编译，不在每次调用时查正则缓存)
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# str.strip() 会去掉的空白字符 (0x20 以下的已包含在控制字符范围内)
+_STRIP_CHARS = "".join(c for c in map(chr, range(0x20, 0x3001)) if c.isspace())
+# 需要清洗的文本：含控制字符 (包括换行、制表符)，或首尾有空白。其余文本 clean_text 后不变
+# 只用 \x 转义和字面字符，Python re 和 Arrow (RE2) 都能解析
+NEEDS_CLEAN_PATTERN = f"[\\x00-\\x1f]|^[{_STRIP_CHARS}]|[{_STRIP_CHARS}]$"
+_NEEDS_CLEAN = re.compile(NEEDS_CLEAN_PATTERN)
+
+
 def clean_text(text):
     """清洗掉可能导致 CSV/Excel 错乱的字符"""
     if not isinstance(text, str): return text
     # 去除换行符、制表符
     text = text.replace('\n', ' ').replace('\r', '').replace('\t', ' ')
     # 去除 Excel 非法控制字符
-    text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', text)
+    text = _CONTROL_CHARS.sub('', text)
     return text.strip()
 
 
+def _needs_clean_mask(series):
+    """
+    整列找出需要清洗的行 (bool 数组)，用 Arrow 的正则内核一次完成。
+    没有 pyarrow，或 object 列里混有非字符串值时返回 None。
+    """
+    if series.dtype != object and pd.api.types.is_string_dtype(series):
+        return series.str.contains(NEEDS_CLEAN_PATTERN, regex=True, na=False).to_numpy(dtype=bool)
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return None
+    try:
+        arr = pa.array(series.to_numpy(dtype=object), type=pa.large_string(), from_pandas=True)
+    except (pa.ArrowException, UnicodeError):
+        return None
+    return pc.match_substring_regex(arr, NEEDS_CLEAN_PATTERN).fill_null(False).to_numpy(zero_copy_only=False)
+
+
+def clean_text_column(series):
+    """
+    整列清洗，结果与 series.map(clean_text) 相同 (非字符串值原样保留，列类型不变)。
+    先整列找出含控制字符或首尾空白的行，只对这些行调用 clean_text；
+    无法整列判断时先 factorize，每个不同的值只清洗一次 (路径列重复度很高)。
+    """
+    dirty = _needs_clean_mask(series)
+    if dirty is not None:
+        out = series.copy()
+        if dirty.any():
+            out[dirty] = [clean_text(v) for v in series[dirty]]
+        return out
+
+    codes, uniques = pd.factorize(series)
+    cleaned = np.array([clean_text(v) if isinstance(v, str) and _NEEDS_CLEAN.search(v) else v
+                        for v in uniques], dtype=object)
+    # 缺失值 (code = -1) 保留原值 (None / NaN 不混淆)
+    values = series.to_numpy(dtype=object, copy=True)
+    valid = codes >= 0
+    values[valid] = cleaned[codes[valid]]
+    return pd.Series(values, index=series.index, name=series.name, dtype=series.dtype)
+
+
 def get_real_file_path(base_path):
     """【修复】智能查找文件，不管是 lables 还是 lables.txt"""
     if os.path.exists(base_path):
@@ -75,73 +140,64 @@ def get_real_file_path(base_path):
         raise FileNotFoundError(f"❌ 找不到外部标签文件: {base_path} 或 {base_path}.txt")
 
 
-def main():
+def main(json_file_path=JSON_FILE_PATH, external_txt_path=EXTERNAL_TXT_PATH,
+         local_model_path=LOCAL_MODEL_PATH, cache_emb_path=CACHE_EMB_PATH, label_cache_dir=LABEL_CACHE_DIR,
+         output_csv_fixed=OUTPUT_CSV_FIXED):
     print("=" * 50)
     print("🚀 启动修复脚本 (利用缓存秒级完成)")
     print("=" * 50)
 
     # 1. 读取项目列表
-    df_projects = extract_projects(JSON_FILE_PATH)
+    df_projects = extract_projects(json_file_path)
     print(f"📊 项目数量: {len(df_projects)}")
 
     # 2. 读取缓存向量
-    if not os.path.exists(CACHE_EMB_PATH):
-        print(f"❌ 严重错误：找不到缓存文件 {CACHE_EMB_PATH}")
+    if not os.path.exists(cache_emb_path):
+        print(f"❌ 严重错误：找不到缓存文件 {cache_emb_path}")
         print("   请确认上一步是否生成了 .npy 文件。")
         return
 
-    print(f"⚡ 读取项目向量缓存: {CACHE_EMB_PATH}")
-    proj_emb = np.load(CACHE_EMB_PATH)
+    print(f"⚡ 读取项目向量缓存: {cache_emb_path}")
+    proj_emb = np.load(cache_emb_path)
 
     if len(proj_emb) != len(df_projects):
         print(f"❌ 错误：项目数量({len(df_projects)}) 与 向量数量({len(proj_emb)}) 不一致！")
         print("   这说明 JSON 文件可能被改过，或者缓存是旧的。请重新运行完整流程。")
         return
 
-    # 3. 计算外部标签向量
-    real_label_path = get_real_file_path(EXTERNAL_TXT_PATH)
+    # 3. 外部标签向量
+    real_label_path = get_real_file_path(external_txt_path)
     print(f"🏷️  加载外部标签文件: {real_label_path}")
 
     with open(real_label_path, 'r', encoding='utf-8') as f:
         ext_labels = [line.strip() for line in f if line.strip()]
 
-    # 加载模型计算外部标签
-    model = load_model_for_external(LOCAL_MODEL_PATH)
-    ext_emb = model.encode(ext_labels, normalize_embeddings=True, show_progress_bar=False)
+    # 标签文件和模型都没变时直接读取缓存，不加载模型
+    ext_emb = load_or_encode_labels(ext_labels, real_label_path, local_model_path,
+                                    lambda labels: encode_external_labels(labels, local_model_path), label_cache_dir)
 
     # 4. 匹配
     print("🔍 正在执行匹配...")
-    sim_matrix = np.dot(proj_emb, ext_emb.T)
+    top_k = 3
+    top_idx_all, top_scores_all = topk_similarity(proj_emb, ext_emb, top_k, max_bytes=TOPK_MAX_BYTES)
 
     # 5. 组装结果
     print("📦 正在组装数据表...")
-    results = []
-    top_k = 3
-
-    for i in range(len(df_projects)):
-        scores = sim_matrix[i]
-        top_idx = scores.argsort()[-top_k:][::-1]
-
-        # 获取原始信息
-        row_data = df_projects.iloc[i].to_dict()
-
-        # 清洗原始项目名和路径 (防止里面的换行符破坏 CSV)
-        row_data["项目名称"] = clean_text(row_data["项目名称"])
-        row_data["原内部路径"] = clean_text(row_data["原内部路径"])
+    df_final = df_projects.reset_index(drop=True)
 
-        # 填入匹配结果
-        for rank, idx in enumerate(top_idx):
-            row_data[f"外部标签_{rank + 1}"] = ext_labels[idx]
-            row_data[f"相似度_{rank + 1}"] = round(float(scores[idx]), 4)
+    # 清洗原始项目名和路径 (防止里面的换行符破坏 CSV)，整列一次完成
+    for col in ("项目名称", "原内部路径"):
+        df_final[col] = clean_text_column(df_final[col])
 
-        results.append(row_data)
+    # 填入匹配结果：直接用下标数组从标签数组里取值
+    df_final = df_final.assign(**topk_columns(ext_labels, top_idx_all, top_scores_all))
 
     # 6. 保存
-    df_final = pd.DataFrame(results)
 
-    print(f"\n💾 正在保存修复后的 CSV: {OUTPUT_CSV_FIXED}")
+    print(f"\n💾 正在保存修复后的 CSV: {output_csv_fixed}")
     # quoting=1 (QUOTE_ALL) 强制加引号，完美解决 CSV 错行问题
-    df_final.to_csv(OUTPUT_CSV_FIXED, index=False, encoding='utf-8-sig', quoting=1)
+    # 同时写一份列式中间文件，step6 优先读取它
+    write_frame(df_final, output_csv_fixed, quoting=1)
 
     print("✅ 修复完成！请查看新生成的 CSV 文件。")
 
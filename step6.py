@@ -1,6 +1,9 @@
+import numpy as np
 import pandas as pd
 import os
-from tqdm import tqdm
+
+from frame_store import read_frame, write_frame
+from mapping_index import get_leaf_name, load_mapping_index
 
 # ================= ⚙️ 配置路径 =================
 PROJECT_CSV = r"D:\predict\data\合同信息\2021_Project_Final_Fixed.csv"
@@ -9,18 +12,6 @@ OUTPUT_FLAT_CSV = r"D:\predict\0.1\data\2021_Project_Flattened_Report_FullPath.c
 
 
 # ================= 🛠️ 辅助函数 =================
-def get_leaf_name(text):
-    """
-    【仅用于匹配键】提取标签的最后一段
-    用于把 '先进制造-增材制造' 和 '增材制造技术' 统一起来进行匹配
-    """
-    if pd.isna(text) or str(text).strip() == "":
-        return ""
-    text = str(text).replace('root > ', '').replace(' > ', '-').replace('>', '-').replace('_', '-').replace('—', '-')
-    parts = text.split('-')
-    return parts[-1].strip()
-
-
 def clean_full_path(text):
     """
     【用于展示】保留完整路径，但清洗掉 root 前缀
@@ -32,7 +23,18 @@ def clean_full_path(text):
     return text
 
 
-def main():
+def map_unique(series, func):
+    """
+    按唯一值计算：先把整列转成 category，每个不同的值只调用一次 func，再按编码映射回整列。
+    标签列里同样的几千个值会在几百万行里反复出现，逐行调用 func 会重复做同样的字符串处理。
+    缺失值 (编码 -1) 对应 func(None)，即表格最后一项。
+    """
+    categorical = series.astype("category")
+    table = np.array([func(v) for v in categorical.cat.categories] + [func(None)], dtype=object)
+    return pd.Series(table[categorical.cat.codes.to_numpy()], index=series.index)
+
+
+def main(project_csv=PROJECT_CSV, mapping_file=MAPPING_FILE, output_flat_csv=OUTPUT_FLAT_CSV):
     print("=" * 50)
     print("🚀 开始生成全路径反查报表")
     print("=" * 50)
@@ -41,46 +43,9 @@ def main():
     # 1. 构建“最强反查字典” (Value 保留完整路径)
     # -------------------------------------------------------
     print("📥 1. 加载映射表 & 构建索引...")
-    if os.path.exists(MAPPING_FILE):
-        map_df = pd.read_excel(MAPPING_FILE).fillna("")
-    else:
-        map_df = pd.read_csv(MAPPING_FILE.replace(".xlsx", ".csv"), encoding='utf-8-sig').fillna("")
-
-    best_match_dict = {}
-
-    for _, row in tqdm(map_df.iterrows(), total=len(map_df), desc="构建索引"):
-        # 【修改点1】这里不再取 leaf，而是保留完整路径
-        internal_full_path = str(row["内部标签"]).strip()
-
-        for i in range(1, 4):
-            ext_col = f"匹配外部标签_{i}"
-            score_col = f"相似度_{i}"
-
-            if ext_col in row and score_col in row:
-                ext_val = row[ext_col]
-                score_val = row[score_col]
-
-                # Key 依然用叶子名，为了能和项目的技术名匹配上
-                ext_key_leaf = get_leaf_name(ext_val)
-
-                if ext_key_leaf and pd.notna(score_val):
-                    try:
-                        current_score = float(score_val)
-                    except:
-                        current_score = 0.0
-
-                    if ext_key_leaf not in best_match_dict:
-                        best_match_dict[ext_key_leaf] = {
-                            "internal_full": internal_full_path,  # 存全路径
-                            "score": current_score
-                        }
-                    else:
-                        # 竞价排名：保留分数更高的那个内部完整路径
-                        if current_score > best_match_dict[ext_key_leaf]["score"]:
-                            best_match_dict[ext_key_leaf] = {
-                                "internal_full": internal_full_path,
-                                "score": current_score
-                            }
+    # 映射表展开成长表后按外部叶子名 groupby 取最高分 (同分时先出现的优先)；映射表没变时直接读取缓存的索引
+    # 【修改点1】Value 保留内部标签的完整路径，Key 依然用叶子名，为了能和项目的技术名匹配上
+    best_match_dict = load_mapping_index(mapping_file).best_match_dict()
 
     print(f"✅ 索引构建完成！")
 
@@ -88,60 +53,38 @@ def main():
     # 2. 处理项目数据
     # -------------------------------------------------------
     print("\n📥 2. 加载项目数据...")
-    projects_df = pd.read_csv(PROJECT_CSV, encoding='utf-8-sig').fillna("")
+    # 保留字典编码 (category)，标签列直接按编码映射
+    projects_df = read_frame(project_csv, categorical=True)
 
-    print("⚡ 3. 正在匹配每一行...")
-    results = []
+    print("⚡ 3. 正在匹配 (按唯一值计算，再按编码映射回每一行)...")
 
-    for _, row in tqdm(projects_df.iterrows(), total=len(projects_df), desc="生成报表"):
-        p_name = row["项目名称"]
+    def column(name):
+        if name in projects_df:
+            return projects_df[name]
+        return pd.Series("", index=projects_df.index)
 
+    def reverse_lookup(text):
+        # 用叶子名作为 Key 反查内部完整路径
+        match = best_match_dict.get(get_leaf_name(text))
+        return match["internal_full"] if match else ""
+
+    final_df = pd.DataFrame({
+        "项目名称": column("项目名称").astype(object).fillna(""),
         # 【修改点2】原归属保留完整路径 (去掉 root > 即可)
-        orig_internal_full = clean_full_path(row["原内部路径"])
-
-        # 提取 AI 匹配的技术 (Key)
-        # 这里的展示列，你可以选择保留全名或者叶子名。
-        # 通常“匹配技术”也是带路径的，建议也保留原样或清洗后展示。
-        # 这里我们展示清洗后的完整技术名（如果有路径的话），方便阅读
-        tech_display_1 = clean_full_path(row.get("外部标签_1", ""))
-        tech_display_2 = clean_full_path(row.get("外部标签_2", ""))
-        tech_display_3 = clean_full_path(row.get("外部标签_3", ""))
-
-        # 提取用于查找的 Key (叶子名)
-        key_1 = get_leaf_name(row.get("外部标签_1", ""))
-        key_2 = get_leaf_name(row.get("外部标签_2", ""))
-        key_3 = get_leaf_name(row.get("外部标签_3", ""))
-
-        # 反查
-        rev_1 = best_match_dict[key_1]["internal_full"] if key_1 in best_match_dict else ""
-        rev_2 = best_match_dict[key_2]["internal_full"] if key_2 in best_match_dict else ""
-        rev_3 = best_match_dict[key_3]["internal_full"] if key_3 in best_match_dict else ""
-
-        results.append({
-            "项目名称": p_name,
-            "原内部归属(完整)": orig_internal_full,
-            "AI匹配技术_1": tech_display_1,
-            "AI匹配技术_2": tech_display_2,
-            "AI匹配技术_3": tech_display_3,
-            "反查归属_1(完整)": rev_1,
-            "反查归属_2(完整)": rev_2,
-            "反查归属_3(完整)": rev_3
-        })
+        "原内部归属(完整)": map_unique(column("原内部路径"), clean_full_path),
+    })
+    # 展示清洗后的完整技术名（如果有路径的话），方便阅读
+    for i in range(1, 4):
+        final_df[f"AI匹配技术_{i}"] = map_unique(column(f"外部标签_{i}"), clean_full_path)
+    # 反查
+    for i in range(1, 4):
+        final_df[f"反查归属_{i}(完整)"] = map_unique(column(f"外部标签_{i}"), reverse_lookup)
 
     # -------------------------------------------------------
     # 3. 保存
     # -------------------------------------------------------
-    print(f"\n💾 4. 正在保存到: {OUTPUT_FLAT_CSV}")
-    final_df = pd.DataFrame(results)
-
-    cols_order = [
-        "项目名称", "原内部归属(完整)",
-        "AI匹配技术_1", "AI匹配技术_2", "AI匹配技术_3",
-        "反查归属_1(完整)", "反查归属_2(完整)", "反查归属_3(完整)"
-    ]
-    final_df = final_df[cols_order]
-
-    final_df.to_csv(OUTPUT_FLAT_CSV, index=False, encoding='utf-8-sig')
+    print(f"\n💾 4. 正在保存到: {output_flat_csv}")
+    write_frame(final_df, output_flat_csv)
     print("🎉 全部完成！")
 
 
@@ -1,15 +1,40 @@
+import numpy as np
 import pandas as pd
 import os
+import time
 from itertools import combinations
 from collections import Counter
 from tqdm import tqdm
 import re
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+
+from frame_store import read_frame, write_frame, frame_exists
+from cooc_store import combine, rank_pairs, save_year
 
 # ================= ⚙️ 配置路径 =================
 # 输入：必须是上一步生成的【全路径】报表
 INPUT_CSV = r"D:\predict\0.1\data\2021_Project_Flattened_Report_FullPath.csv"
 # 输出：共现统计结果
 OUTPUT_CSV = r"D:\predict\0.1\data\2021_Internal_Cooccurrence_Stats.csv"
+# 多年份共现计数库中该年份的文件 (同目录下的 labels.json 为共享标签字典)，设为 None 则不保存
+COOC_PATH = r"D:\predict\0.1\cooc_store\internal_2021.npz"
+
+# 计数方式："sparse" 标签编码成整数后用稀疏关联矩阵 X.T @ X 一次算出所有组合；"loop" 为旧的 iterrows + Counter 逐行统计
+COUNT_MODE = "sparse"
+# 【实验功能】sparse 模式下大于 1 时按行区间分片，多进程并行计数后在主进程归并 (结果与单进程一致)。
+# 目前还没有测到加速：200 万行时单进程 7.0s，分片 9.1~9.3s (单核机器，分片多了编码、传输和归并的开销)。
+# 保持 1；只有在目标机器上用 bench_cooccurrence.py --workers 实测快于单进程后再调大
+COUNT_WORKERS = 1
+# 每个分片的目标行数；分片数至少等于进程数
+SHARD_ROWS = 1000000
+
+TARGET_COLS = [
+    "原内部归属(完整)",
+    "反查归属_1(完整)",
+    "反查归属_2(完整)",
+    "反查归属_3(完整)"
+]
 
 
 # ================= 🛠️ 辅助函数 =================
@@ -23,47 +48,21 @@ def get_leaf_name(text):
     return parts[-1].strip()
 
 
-def main():
-    print("=" * 50)
-    print("🚀 开始统计共现频率 (组合名简化，源数据完整)")
-    print("=" * 50)
-
-    # 1. 加载数据
-    print("📥 正在加载报表数据...")
-    if not os.path.exists(INPUT_CSV):
-        print(f"❌ 错误：找不到文件 {INPUT_CSV}")
-        return
-
-    df = pd.read_csv(INPUT_CSV, encoding='utf-8-sig').fillna("")
-    print(f"✅ 加载完成: {len(df)} 行")
-
-    # 2. 准备统计器
+def count_pairs_loop(df):
+    """旧方式：逐行收集标签集合，两两组合后用 Counter 计数，返回 most_common 顺序的 (A 列表, B 列表, 次数列表)"""
     # Key 是元组: (完整路径A, 完整路径B)
     pair_counter = Counter()
 
-    target_cols = [
-        "原内部归属(完整)",
-        "反查归属_1(完整)",
-        "反查归属_2(完整)",
-        "反查归属_3(完整)"
-    ]
-
-    valid_rows_count = 0
-
-    # 3. 遍历统计
-    print("⚡ 正在计算共现矩阵...")
     for _, row in tqdm(df.iterrows(), total=len(df)):
 
         # 过滤：原内部归属必须存在
-        original_path = str(row[target_cols[0]]).strip()
+        original_path = str(row[TARGET_COLS[0]]).strip()
         if not original_path:
             continue
 
-        valid_rows_count += 1
-
         # 收集该行所有不为空的归属标签（全路径）
         labels_in_row = set()
-        for col in target_cols:
+        for col in TARGET_COLS:
             val = str(row.get(col, "")).strip()
             if val:
                 labels_in_row.add(val)
@@ -77,32 +76,204 @@ def main():
         for pair in combinations(sorted_labels, 2):
             pair_counter[pair] += 1
 
-    # 4. 格式化输出
-    print(f"\n📊 统计完成，正在生成 CSV...")
+    # most_common() 默认按次数降序排列
+    ranked = pair_counter.most_common()
+    return [a for (a, _), _ in ranked], [b for (_, b), _ in ranked], [count for _, count in ranked]
 
-    result_data = []
 
-    # most_common() 默认按次数降序排列
-    for (path_a, path_b), count in pair_counter.most_common():
-        # 提取叶子名用于第一列展示
-        leaf_a = get_leaf_name(path_a)
-        leaf_b = get_leaf_name(path_b)
+def encode_label_rows(df, cols=TARGET_COLS):
+    """
+    把各归属列编码成整数，返回 (codes, labels)：
+    codes : (有效行数, 列数) int32，每行是该行去重后的标签编码，升序排在前面，空位为 -1
+    labels: 按字符串排序的标签数组，编码即下标 (编码大小顺序与字符串排序一致)
+    """
+    # 每列各自 factorize (Arrow 字符串列不必转成 Python 对象)，再把各列的不同值合并成一个按字符串排序的标签表
+    col_codes, col_uniques = [], []
+    for col in cols:
+        if col in df:
+            codes, uniques = pd.factorize(df[col].astype(str).str.strip())
+        else:
+            codes, uniques = np.full(len(df), -1, dtype=np.intp), pd.Index([], dtype=object)
+        col_codes.append(codes)
+        col_uniques.append(uniques)
+    labels = np.array(sorted(set().union(*(u.tolist() for u in col_uniques)) - {""}), dtype=object)
+    label_index = pd.Index(labels, dtype=object)
+
+    # 空位先用 n_labels 占位 (排在所有标签之后)，行内排序后把重复的标签也换成占位，再排一次
+    n_labels = len(labels)
+    codes = np.full((len(df), len(cols)), n_labels, dtype=np.int64)
+    for slot, (local, uniques) in enumerate(zip(col_codes, col_uniques)):
+        if len(uniques):
+            lookup = label_index.get_indexer(uniques)  # "" 不在标签表中，为 -1
+            mapped = lookup[local]
+            codes[:, slot] = np.where((local >= 0) & (mapped >= 0), mapped, n_labels)
+    # 有效行与旧逻辑相同：原内部归属 str().strip() 后不为空
+    if len(cols):
+        codes = codes[codes[:, 0] < n_labels]
+    codes.sort(axis=1)
+    dup = codes[:, 1:] == codes[:, :-1]
+    codes[:, 1:][dup] = n_labels
+    codes.sort(axis=1)
+    codes[codes == n_labels] = -1
+    return codes.astype(np.int32), labels
+
+
+def incidence_matrix(codes, n_labels):
+    """稀疏关联矩阵 X: (行数, 标签数)，该行出现某标签则为 1"""
+    rows, slots = np.nonzero(codes >= 0)
+    data = np.ones(len(rows), dtype=np.int32)
+    return sparse.csr_matrix((data, (rows, codes[rows, slots])), shape=(len(codes), n_labels))
+
+
+def first_occurrence(codes, pair_a, pair_b, n_labels):
+    """
+    每个组合第一次出现的先后次序 (逐行、行内按 combinations 顺序展开时的位置)。
+    Counter.most_common 对次数相同的组合保持插入顺序，排序时用它打破平局。
+    """
+    slot_pairs = list(combinations(range(codes.shape[1]), 2))
+    left = codes[:, [i for i, _ in slot_pairs]].astype(np.int64)
+    right = codes[:, [j for _, j in slot_pairs]].astype(np.int64)
+    valid = right >= 0  # 编码升序排在前面，右边有效则左边一定有效
+    keys = (left * n_labels + right)[valid]
+    unique_keys, first_idx = np.unique(keys, return_index=True)
+    target = pair_a.astype(np.int64) * n_labels + pair_b
+    return first_idx[np.searchsorted(unique_keys, target)]
+
 
-        # 拼接组合名
-        combo_name = f"{leaf_a} & {leaf_b}"
+def pair_counts_from_codes(codes, n_labels):
+    """
+    共现次数为 X.T @ X 的上三角。返回编码对 (a, b, counts, first)，a < b，
+    first 为组合首次出现的先后次序 (越小越早)。
+    """
+    x = incidence_matrix(codes, n_labels)
+    # 上三角 (a < b) 即按字符串排序后的 (A, B)，与 sorted + combinations 的组合方向一致
+    cooc = sparse.triu(x.T @ x, k=1).tocoo()
+    pair_a, pair_b, counts = cooc.row, cooc.col, cooc.data.astype(np.int64)
+    return pair_a, pair_b, counts, first_occurrence(codes, pair_a, pair_b, n_labels)
 
-        result_data.append({
-            "归属组合(简化)": combo_name,
-            "同时出现次数": count,
-            "标签_A(完整路径)": path_a,
-            "标签_B(完整路径)": path_b
-        })
 
-    result_df = pd.DataFrame(result_data)
+def sparse_pair_counts(df):
+    """
+    标签编码 + 稀疏矩阵计数。
+    返回按首次出现先后排列的 (A 数组, B 数组, 次数数组)，A 按字符串排序在 B 之前 (即计数库保存的格式)。
+    """
+    codes, labels = encode_label_rows(df)
+    pair_a, pair_b, counts, first = pair_counts_from_codes(codes, len(labels))
+    order = np.argsort(first)
+    return labels[pair_a[order]], labels[pair_b[order]], counts[order]
+
+
+def _count_shard(shard):
+    """
+    子进程：对一个行区间编码并计数。返回 ((局部标签表, a, b, 次数), 耗时统计)，
+    组合按分片内首次出现先后排列；只传回几个一维数组，不传稀疏矩阵。
+    """
+    start_t = time.time()
+    codes, labels = encode_label_rows(shard)
+    encode_seconds = time.time() - start_t
+    pair_a, pair_b, counts, first = pair_counts_from_codes(codes, len(labels))
+    order = np.argsort(first)
+    part = (labels, pair_a[order], pair_b[order], counts[order])
+    stats = {"rows": len(shard), "encode": encode_seconds, "count": time.time() - start_t - encode_seconds,
+             "pairs": len(counts)}
+    return part, stats
+
+
+def sharded_pair_counts(df, workers, shard_rows=SHARD_ROWS):
+    """
+    【实验功能，尚未测到比 sparse_pair_counts 更快，见 COUNT_WORKERS 的说明】
+    按行区间分片，多进程各自编码、计数，再在主进程一次归并。
+    分片按行号先后拼接，拼接后的位置就是全局的首次出现先后，所以可以直接用 cooc_store.combine
+    (与多年份合计相同的归并)。结果与 sparse_pair_counts 完全一致 (按首次出现先后排列)。
+    """
+    n_shards = max(1, min(len(df), max(workers, -(-len(df) // shard_rows))))
+    bounds = np.linspace(0, len(df), n_shards + 1).astype(np.int64)
+    cols = [col for col in TARGET_COLS if col in df]
+    tasks = (df.iloc[start:end][cols] for start, end in zip(bounds[:-1], bounds[1:]))
+    print(f"   切分为 {n_shards} 个分片，使用 {workers} 个进程并行计数...")
+
+    start_t = time.time()
+    parts = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map 按提交顺序返回
+        for i, (part, stats) in enumerate(pool.map(_count_shard, tasks)):
+            parts.append(part)
+            print(f"   分片 {i + 1}/{n_shards}: {stats['rows']} 行，编码 {stats['encode']:.2f}s，"
+                  f"计数 {stats['count']:.2f}s，{stats['pairs']} 个组合 (已耗时 {time.time() - start_t:.2f}s)")
+
+    # 各分片的局部编码换成全局标签表 (仍按字符串排序，a < b 的方向不变) 的编码
+    merge_t = time.time()
+    labels = np.array(sorted(set().union(*(part[0].tolist() for part in parts))), dtype=object)
+    index = pd.Index(labels, dtype=object)
+    remapped = []
+    for shard_labels, pair_a, pair_b, counts in parts:
+        mapping = index.get_indexer(pd.Index(shard_labels, dtype=object))
+        remapped.append((mapping[pair_a], mapping[pair_b], counts))
+    pair_a, pair_b, counts = combine(remapped, max(len(labels), 1))
+    print(f"   主进程归并 {n_shards} 个分片: {time.time() - merge_t:.2f}s")
+    return labels[pair_a], labels[pair_b], counts
+
+
+def count_pairs_sparse(df):
+    """与 count_pairs_loop 相同顺序的结果：次数降序；次数相同时按首次出现的先后 (与 most_common 一致)"""
+    return rank_pairs(*sparse_pair_counts(df))
+
+
+def build_result_frame(paths_a, paths_b, counts):
+    """组合名用叶子名拼接 (每个标签只算一次叶子名)"""
+    paths_a = pd.Series(paths_a, dtype=object)
+    paths_b = pd.Series(paths_b, dtype=object)
+    leaf = {path: get_leaf_name(path) for path in set(paths_a) | set(paths_b)}
+    return pd.DataFrame({
+        "归属组合(简化)": paths_a.map(leaf).astype(object) + " & " + paths_b.map(leaf).astype(object),
+        "同时出现次数": np.asarray(counts, dtype=np.int64),
+        "标签_A(完整路径)": paths_a,
+        "标签_B(完整路径)": paths_b
+    })
+
+
+def main(input_csv=INPUT_CSV, output_csv=OUTPUT_CSV, cooc_path=COOC_PATH, workers=COUNT_WORKERS):
+    print("=" * 50)
+    print("🚀 开始统计共现频率 (组合名简化，源数据完整)")
+    print("=" * 50)
+
+    # 1. 加载数据
+    print("📥 正在加载报表数据...")
+    if not frame_exists(input_csv):
+        print(f"❌ 错误：找不到文件 {input_csv}")
+        return
+
+    df = read_frame(input_csv).fillna("")
+    print(f"✅ 加载完成: {len(df)} 行")
+
+    # 2. 统计
+    print(f"⚡ 正在计算共现矩阵 ({COUNT_MODE})...")
+    start_t = time.time()
+    if COUNT_MODE == "loop":
+        paths_a, paths_b, counts = count_pairs_loop(df)
+    else:
+        if workers > 1:
+            print(f"⚠️ 分片计数 ({workers} 个进程) 是实验功能，目前没有测到比单进程更快")
+            by_first = sharded_pair_counts(df, workers)
+        else:
+            by_first = sparse_pair_counts(df)
+        paths_a, paths_b, counts = rank_pairs(*by_first)
+    print(f"✅ 共现统计耗时: {time.time() - start_t:.2f}s")
+
+    # 存入多年份计数库，之后任意年份区间 / 滚动窗口直接由 cooc_store.py 合计，不再读报表
+    if cooc_path:
+        if COUNT_MODE == "loop":
+            print("⚠️ loop 模式不保存计数库 (需要按首次出现顺序的结果)")
+        else:
+            save_year(cooc_path, *by_first)
+
+    # 3. 格式化输出
+    print(f"\n📊 统计完成，正在生成 CSV...")
+    result_df = build_result_frame(paths_a, paths_b, counts)
 
     # 保存
-    print(f"💾 正在保存结果到: {OUTPUT_CSV}")
-    result_df.to_csv(OUTPUT_CSV, index=False, encoding='utf-8-sig')
+    print(f"💾 正在保存结果到: {output_csv}")
+    write_frame(result_df, output_csv)
 
     print("🎉 全部完成！")
     if not result_df.empty:
@@ -1,9 +1,15 @@
+import numpy as np
 import pandas as pd
 import os
 from itertools import combinations
 from collections import Counter, defaultdict
 from tqdm import tqdm
 import re
+from scipy import sparse
+
+from frame_store import read_frame, write_frame
+from mapping_index import load_mapping_index
+from graph_store import write_graph, NODE_COLUMNS
 
 # ================= ⚙️ 配置 =================
 # 1. 项目全路径报表 (来源)
@@ -12,11 +18,21 @@ PROJECT_CSV = r"D:\predict\0.1\data\2022_Project_Flattened_Report_FullPath.csv"
 MAPPING_FILE = r"D:\predict\0.1\label_mapping_result.xlsx"
 # 3. 输出结果
 OUTPUT_CSV = r"D:\predict\0.1\data\2022_External_Tech_Weighted_Graph.csv"
+# 4. 图谱的二进制导出 (节点表 + 边表，后缀 .parquet 或 .npz)，设为 None 则只输出 CSV
+GRAPH_PATH = r"D:\predict\0.1\data\2022_External_Tech_Graph.parquet"
+# 二进制导出时每个节点只保留权重最高的前 N 条边，None 为不裁剪 (CSV 始终是完整的)
+GRAPH_TOP_N = None
 
 # 权重系数
 WEIGHT_DIRECT = 1.0  # 直接共现权重
 WEIGHT_INDIRECT_FACTOR = 0.3  # 间接共现系数 (内部业务出现次数 * 0.3)
 
+# 计算方式："sparse" 用稀疏关联矩阵一次算出所有边权；"loop" 为旧的 iterrows + Counter 逐行累加
+WEIGHT_MODE = "sparse"
+
+EDGE_COLUMNS = ["Source", "Target", "Weight", "Direct_Score", "Indirect_Score",
+                "Source_L1", "Source_L2", "Target_L1", "Target_L2"]
+
 
 # ================= 🛠️ 辅助函数 =================
 def get_leaf_name(text):
@@ -45,17 +61,12 @@ def get_full_path_tuple(text):
     return (parts[-3], parts[-2], parts[-1])  # L1, L2, L3
 
 
-def main():
-    print("=" * 50)
-    print("🚀 开始构建混合加权外部技术图谱")
-    print("=" * 50)
-
+def weighted_edges_loop(project_df, mapping_file):
+    """旧方式：逐行累加直接共现、逐行遍历映射表累加间接共现，再用集合合并所有边"""
     # ----------------------------------------------------
     # 1. 统计内部标签在项目中出现的次数 (用于计算间接权重)
     # ----------------------------------------------------
     print("📥 正在统计内部业务活跃度...")
-    project_df = pd.read_csv(PROJECT_CSV, encoding='utf-8-sig').fillna("")
-
     # 计数器: { "先进制造-工艺-其他": 500次 }
     internal_usage_counts = Counter()
 
@@ -97,16 +108,14 @@ def main():
     # 2. 计算间接共现 (基于映射表)
     # ----------------------------------------------------
     print("📥 正在计算间接结构权重...")
-    if os.path.exists(MAPPING_FILE):
-        map_df = pd.read_excel(MAPPING_FILE).fillna("")
-    else:
-        map_df = pd.read_csv(MAPPING_FILE.replace(".xlsx", ".csv"), encoding='utf-8-sig').fillna("")
+    # 映射表展开后的长表与 step6 共用，映射表没变时直接读取缓存的索引 (不再读 xlsx)
+    mapping = load_mapping_index(mapping_file)
 
     indirect_edge_weights = Counter()
 
-    for _, row in map_df.iterrows():
+    for raw_internal, full_tags in mapping.iter_rows():
         # 获取该行的内部标签
-        map_internal = clean_internal_key(row["内部标签"])
+        map_internal = clean_internal_key(raw_internal)
 
         # 获取该内部标签在项目中出现的次数 (活跃度)
         # 注意：映射表里的名字可能和项目表里有一点点差异，这里尽量匹配
@@ -116,13 +125,11 @@ def main():
         if occur_count > 0:
             # 提取该业务对应的 3 个标准外部技术
             std_techs = []
-            for i in range(1, 4):
-                full_tag = row.get(f"匹配外部标签_{i}")
-                if full_tag:
-                    leaf = get_leaf_name(full_tag)
-                    std_techs.append(leaf)
-                    if leaf not in tech_hierarchy_map:
-                        tech_hierarchy_map[leaf] = get_full_path_tuple(full_tag)
+            for full_tag in full_tags:
+                leaf = get_leaf_name(full_tag)
+                std_techs.append(leaf)
+                if leaf not in tech_hierarchy_map:
+                    tech_hierarchy_map[leaf] = get_full_path_tuple(full_tag)
 
             # 计算间接权重： 活跃度 * 系数
             weight_add = occur_count * WEIGHT_INDIRECT_FACTOR
@@ -160,15 +167,127 @@ def main():
             "Source_L1": l1_a, "Source_L2": l2_a,
             "Target_L1": l1_b, "Target_L2": l2_b
         })
+    nodes = pd.DataFrame([(leaf, *tech_hierarchy_map[leaf]) for leaf in sorted(tech_hierarchy_map)],
+                         columns=NODE_COLUMNS)
+    return pd.DataFrame(edge_list, columns=EDGE_COLUMNS), nodes
+
+
+def pair_sums(rows, nodes, n_rows, n_nodes, row_weights=None):
+    """
+    rows / nodes 为逐格展开的 (行号, 节点编码)，同一行里重复的节点只算一次 (与 set 去重一致)。
+    返回上三角 (a < b) 的 CSR：每个组合的 Σ 行权重 (不传 row_weights 时即同时出现的行数)，
+    即 X.T @ diag(row_weights) @ X，X 为 (行数, 节点数) 的 0/1 关联矩阵。
+    """
+    # 构造时重复的格子会被加在一起，再统一改回 1
+    x = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, nodes)), shape=(n_rows, n_nodes))
+    x.data[:] = 1
+    xw = x
+    if row_weights is not None:
+        xw = x.copy()
+        xw.data = row_weights[np.repeat(np.arange(n_rows), np.diff(x.indptr))]
+    return sparse.triu(x.T @ xw, k=1, format="csr")
+
+
+def weighted_edges_sparse(project_df, mapping_file):
+    """
+    直接权重 = WEIGHT_DIRECT * X_proj.T @ X_proj
+    间接权重 = WEIGHT_INDIRECT_FACTOR * X_map.T @ diag(内部业务出现次数) @ X_map
+    节点编码按叶子名字符串排序，a < b 即 sorted + combinations 的组合方向。
+    """
+    print("📥 正在统计内部业务活跃度...")
+    # 每个不同的原内部归属只清洗一次
+    codes, uniques = pd.factorize(project_df["原内部归属(完整)"])
+    internal_keys = np.array([clean_internal_key(v) for v in uniques] + [""], dtype=object)[codes]
+    internal_usage_counts = pd.Series(internal_keys[internal_keys != ""]).value_counts()
+
+    # AI匹配技术_1~3 按行展开 (行号, 完整标签)，与 row.get() 的真值判断一致：缺失的列和空字符串跳过
+    print("⚡ 计算直接共现 & 内部统计...")
+    tag_cols = [f"AI匹配技术_{i}" for i in range(1, 4) if f"AI匹配技术_{i}" in project_df]
+    cells = project_df[tag_cols].to_numpy(dtype=object)
+    present = cells.astype(bool)
+    proj_rows = np.nonzero(present)[0]
+    proj_tags = cells[present]
+    print(f"✅ 内部业务统计完成，共 {len(internal_usage_counts)} 个活跃部门")
+
+    print("📥 正在计算间接结构权重...")
+    # 映射表展开后的长表与 step6 共用，映射表没变时直接读取缓存的索引 (不再读 xlsx)
+    mapping = load_mapping_index(mapping_file)
+    codes, uniques = pd.factorize(mapping.internal)
+    map_keys = pd.Index([clean_internal_key(v) for v in uniques], dtype=object)
+    occur = internal_usage_counts.reindex(map_keys).fillna(0).to_numpy(dtype=np.int64)[codes]
+    # 只有在项目中出现过的内部业务才贡献间接权重 (层级信息也只从这些行收集)
+    active = occur > 0
+    map_rows = mapping.row[active].astype(np.int64)
+    map_tags = mapping.external[active].astype(object)
+    n_map_rows = int(mapping.row.max()) + 1 if len(mapping) else 0
+    row_occur = np.zeros(n_map_rows, dtype=np.int64)
+    row_occur[map_rows] = occur[active]
+
+    # 节点 = 叶子名。每个不同的完整标签只算一次叶子名；
+    # factorize 保持首次出现的顺序 (项目表逐行在前，映射表在后)，层级取该叶子名第一次出现时的完整标签
+    tag_codes, tag_uniques = pd.factorize(np.concatenate([proj_tags, map_tags]))
+    tag_leaves = np.array([get_leaf_name(v) for v in tag_uniques], dtype=object)
+    nodes, leaf_first, tag_node = np.unique(tag_leaves, return_index=True, return_inverse=True)
+    hierarchy = [get_full_path_tuple(tag_uniques[i]) for i in leaf_first]
+    node_l1 = np.array([h[0] for h in hierarchy], dtype=object)
+    node_l2 = np.array([h[1] for h in hierarchy], dtype=object)
+    node_l3 = np.array([h[2] for h in hierarchy], dtype=object)
+    entry_node = tag_node[tag_codes]
+
+    n_nodes = len(nodes)
+    direct = pair_sums(proj_rows, entry_node[:len(proj_tags)], len(project_df), n_nodes)
+    indirect = pair_sums(map_rows, entry_node[len(proj_tags):], n_map_rows, n_nodes, row_occur)
+
+    print("🔄 正在合并权重...")
+    # 稀疏相加：两者非零位置的并集就是所有的边 (都是 >= 1 的整数，不会相消)
+    total = direct + indirect
+    total.sum_duplicates()
+    # 直接 / 间接各自加上并集的 0/1 模式后，非零位置都与 total 相同、data 顺序一致，减 1 即各自的值 (没有的一方为 0)
+    pattern = total.astype(bool).astype(np.int64)
+    per_side = []
+    for part in (direct, indirect):
+        aligned = part + pattern
+        aligned.sum_duplicates()
+        per_side.append(aligned.data - 1)
+    total = total.tocoo()
+    pair_a, pair_b = total.row, total.col
+    w_d = per_side[0] * WEIGHT_DIRECT
+    w_i = per_side[1] * WEIGHT_INDIRECT_FACTOR
+
+    edges = pd.DataFrame({
+        "Source": nodes[pair_a],
+        "Target": nodes[pair_b],
+        "Weight": np.round(w_d + w_i, 2),
+        "Direct_Score": w_d,
+        "Indirect_Score": np.round(w_i, 2),
+        "Source_L1": node_l1[pair_a], "Source_L2": node_l2[pair_a],
+        "Target_L1": node_l1[pair_b], "Target_L2": node_l2[pair_b],
+    }, columns=EDGE_COLUMNS)
+    return edges, pd.DataFrame({"leaf": nodes, "L1": node_l1, "L2": node_l2, "L3": node_l3}, columns=NODE_COLUMNS)
+
+
+def main(project_csv=PROJECT_CSV, mapping_file=MAPPING_FILE, output_csv=OUTPUT_CSV, graph_path=GRAPH_PATH,
+         graph_top_n=GRAPH_TOP_N):
+    print("=" * 50)
+    print("🚀 开始构建混合加权外部技术图谱")
+    print("=" * 50)
+
+    project_df = read_frame(project_csv).fillna("")
+    if WEIGHT_MODE == "loop":
+        df_out, nodes = weighted_edges_loop(project_df, mapping_file)
+    else:
+        df_out, nodes = weighted_edges_sparse(project_df, mapping_file)
 
-    print(f"💾 正在保存 {len(edge_list)} 条边到 CSV...")
-    df_out = pd.DataFrame(edge_list)
+    print(f"💾 正在保存 {len(df_out)} 条边到 CSV...")
 
-    # 按权重降序排列
-    df_out = df_out.sort_values(by="Weight", ascending=False)
+    # 按权重降序排列；同权重按 (Source, Target) 排，每次运行的输出顺序一致
+    df_out = df_out.sort_values(by=["Weight", "Source", "Target"], ascending=[False, True, True],
+                                kind="stable").reset_index(drop=True)
 
-    df_out.to_csv(OUTPUT_CSV, index=False, encoding='utf-8-sig')
-    print(f"🎉 完成！文件已保存: {OUTPUT_CSV}")
+    write_frame(df_out, output_csv)
+    if graph_path:
+        write_graph(graph_path, nodes, df_out, graph_top_n)
+    print(f"🎉 完成！文件已保存: {output_csv}")
 
 
 if __name__ == "__main__":
@@ -6,6 +6,8 @@ from statsmodels.tsa.stattools import grangercausalitytests
 import warnings
 import os
 
+from graph_store import GRAPH_SUFFIXES, load_graph, edge_list
+
 # ================= 配置区 =================
 warnings.filterwarnings("ignore")
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']
@@ -87,10 +89,23 @@ def load_project_data(file_path):
 # =========================================================
 # 2. 读取共现权重表
 # =========================================================
+def load_graph_edges(file_path, weight_threshold):
+    """step8 导出的二进制图谱：先按权重筛选整数边表，只把留下的边换回技术名称。返回 (边表, 筛选前条数)"""
+    nodes, edges = load_graph(file_path)
+    if edges.attrs.get("top_n") is not None:
+        print(f"   > 图谱导出时已按每个节点前 {edges.attrs['top_n']} 条边裁剪")
+    weight = edges['weight'].to_numpy(dtype=np.float64).round(2)
+    return edge_list(nodes, edges[weight > weight_threshold]), len(edges)
+
+
 def load_cooc_data(file_path, weight_threshold=10):
     print(f"--- [2/4] 正在读取共现表: {os.path.basename(file_path)} ---")
     try:
-        df = read_file_smartly(file_path)
+        if os.path.splitext(file_path)[1].lower() in GRAPH_SUFFIXES:
+            df, initial_count = load_graph_edges(file_path, weight_threshold)
+        else:
+            df = read_file_smartly(file_path)
+            initial_count = len(df)
     except Exception as e:
         print(f"❌ 共现表读取失败: {e}")
         return pd.DataFrame()
@@ -101,7 +116,6 @@ def load_cooc_data(file_path, weight_threshold=10):
         print("❌ 错误: 共现表缺少 Source/Target/Weight 列")
         return pd.DataFrame()
 
-    initial_count = len(df)
     df_filtered = df[df['Weight'] > weight_threshold].copy()
 
     candidates = df_filtered[['Source', 'Target', 'Weight']].copy()
@@ -215,7 +229,8 @@ def plot_result_pair(ts_data, tech_a, tech_b, lag):
 if __name__ == "__main__":
     # 路径配置
     project_file = r"D:\predict\0.1\data\2025_Project_Flattened_Report_FullPath.csv"
-    cooc_file = r"D:\predict\0.1\data\2025_External_Tech_Weighted_Graph.csv"
+    # step8 导出的二进制图谱 (_nodes/_edges 两个文件)；也可以直接用 2025_External_Tech_Weighted_Graph.csv
+    cooc_file = r"D:\predict\0.1\data\2025_External_Tech_Graph.parquet"
 
     # 1. 加载
     df_proj_long = load_project_data(project_file)
@@ -0,0 +1,70 @@
+import numpy as np
+
+# ================= 分块 Top-K 相似度匹配 =================
+# 不再一次性构建 N×M 的完整相似度矩阵再逐行 argsort：
+# 按查询行分块计算 块×M 的相似度，用 argpartition 取出每行前 k 个再对这 k 个排序，
+# 最终只保留 N×k 的 (下标, 分数)。块大小由内存上限决定。
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2  # 512MB
+
+
+def block_rows_for(n_keys, max_bytes=DEFAULT_MAX_BYTES, itemsize=4):
+    """在内存上限内每块可以放多少行 (相似度块 + argpartition 的 int64 下标)"""
+    per_row = max(1, n_keys) * (itemsize + 8)
+    return max(1, int(max_bytes // per_row))
+
+
+def topk_similarity(queries, keys, k, max_bytes=DEFAULT_MAX_BYTES, verbose=True):
+    """
+    queries: (N, D)，keys: (M, D)，均为归一化向量时分数即余弦相似度
+    返回 (indices, scores)，形状都是 (N, k)，每行按分数从高到低排列
+    """
+    queries = np.asarray(queries)
+    keys = np.asarray(keys)
+    n, m = len(queries), len(keys)
+    k = min(k, m)
+
+    dtype = np.result_type(queries.dtype, keys.dtype)
+    indices = np.empty((n, k), dtype=np.int64)
+    scores = np.empty((n, k), dtype=dtype)
+    if n == 0 or k == 0:
+        return indices, scores
+
+    block_rows = block_rows_for(m, max_bytes, dtype.itemsize)
+    n_blocks = -(-n // block_rows)
+    if verbose:
+        print(f"🧮 分块 Top-{k}: {n} × {m}，每块 {min(block_rows, n)} 行，共 {n_blocks} 块")
+
+    keys_t = keys.T
+    for start in range(0, n, block_rows):
+        end = min(start + block_rows, n)
+        block = queries[start:end] @ keys_t
+
+        if k < m:
+            # 每行最大的 k 个 (无序) 位于末尾
+            part = np.argpartition(block, m - k, axis=1)[:, m - k:]
+        else:
+            part = np.broadcast_to(np.arange(m), block.shape)
+        part_scores = np.take_along_axis(block, part, axis=1)
+
+        # 只对这 k 个排序 (从高到低)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        indices[start:end] = np.take_along_axis(part, order, axis=1)
+        scores[start:end] = np.take_along_axis(part_scores, order, axis=1)
+
+    return indices, scores
+
+
+def topk_columns(labels, indices, scores, label_prefix="外部标签_", score_prefix="相似度_", decimals=4):
+    """
+    把 Top-K 结果直接展开成结果表的列 (不逐行构建字典)：
+    { 外部标签_1, 相似度_1, 外部标签_2, 相似度_2, ... }，列顺序与原来逐行构建时一致。
+    分数按 float64 四舍五入到 decimals 位，与 round(float(score), 4) 的结果相同。
+    """
+    labels = np.asarray(labels, dtype=object)
+    rounded = np.round(np.asarray(scores, dtype=np.float64), decimals)
+    columns = {}
+    for rank in range(indices.shape[1]):
+        columns[f"{label_prefix}{rank + 1}"] = labels[indices[:, rank]]
+        columns[f"{score_prefix}{rank + 1}"] = rounded[:, rank]
+    return columns
\ No newline at end of file
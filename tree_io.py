@@ -0,0 +1,117 @@
+import json
+import os
+from json.encoder import encode_basestring
+
+# ================= 技术树的流式读写 =================
+# 输入是 step2 构建期的索引树：节点为 {"children": {名称: 子节点}, "projects": [...] 或 None}
+# 写出的 JSON 与 json.dump(to_output_tree(root), ensure_ascii=False, indent=...) 完全一致，
+# 但是按子树逐段写入文件，不需要先把整棵树转换成列表结构、也不经过编码器的整体缓冲。
+
+
+def _encode(text):
+    # 与 json.dump(..., ensure_ascii=False) 对字符串的编码方式相同
+    return encode_basestring(text)
+
+
+def write_tree_json(root, fp, indent=2, compact=False):
+    """
+    流式写出技术树
+    indent=2     : 与原来的 json.dump(indent=2) 一致
+    indent=None  : 不缩进，单行输出 (", " / ": " 分隔)
+    compact=True : 不缩进且去掉所有空格，文件最小
+    """
+    write = fp.write
+
+    if compact or indent is None:
+        item_sep, key_sep = (",", ":") if compact else (", ", ": ")
+
+        def write_node(node, name):
+            write('{"name"' + key_sep + _encode(name) + item_sep + '"children"' + key_sep + '[')
+            first = True
+            for child_name, child in node["children"].items():
+                if not first:
+                    write(item_sep)
+                first = False
+                write_node(child, child_name)
+            write(']')
+            if node["projects"] is not None:
+                write(item_sep + '"projects"' + key_sep + '[' + item_sep.join(map(_encode, node["projects"])) + ']')
+            write('}')
+
+        write_node(root, "root")
+        return
+
+    pad = " " * indent
+
+    def write_node(node, name, level):
+        inner = "\n" + pad * (level + 1)
+        item = "\n" + pad * (level + 2)
+
+        write('{' + inner + '"name": ' + _encode(name) + ',' + inner + '"children": ')
+        children = node["children"]
+        if children:
+            write('[')
+            first = True
+            for child_name, child in children.items():
+                write(item if first else ',' + item)
+                first = False
+                write_node(child, child_name, level + 2)
+            write(inner + ']')
+        else:
+            write('[]')
+
+        projects = node["projects"]
+        if projects is not None:
+            write(',' + inner + '"projects": ')
+            if projects:
+                write('[' + item + (',' + item).join(map(_encode, projects)) + inner + ']')
+            else:
+                write('[]')
+        write("\n" + pad * level + '}')
+
+    write_node(root, "root", 0)
+
+
+# ================= 扁平项目清单 (JSON Lines) =================
+# 每行一条 {"project": 项目名称, "path": "root > A > B"}，顺序与 step4/step5 递归解析 JSON 的顺序一致，
+# 下游可以逐行读取，不必把整棵树 json.load 进内存。
+
+def flat_projects_path(json_path):
+    """2014_tree.json -> 2014_tree.projects.jsonl"""
+    base, _ = os.path.splitext(json_path)
+    return base + ".projects.jsonl"
+
+
+def write_flat_projects(root, path):
+    """按先序遍历（先本节点项目，再子节点）写出扁平项目清单，返回写出的条数"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        def recurse(node, curr_path):
+            nonlocal count
+            if node["projects"] is not None:
+                path_json = _encode(curr_path)
+                for p in node["projects"]:
+                    f.write('{"project": ' + _encode(p) + ', "path": ' + path_json + '}\n')
+                count += len(node["projects"])
+            for child_name, child in node["children"].items():
+                recurse(child, f"{curr_path} > {child_name}")
+
+        recurse(root, "root")
+    return count
+
+
+def find_flat_projects(json_path):
+    """如果 JSON 旁边有不比它旧的扁平清单，返回清单路径，否则返回 None"""
+    path = flat_projects_path(json_path)
+    if os.path.exists(path) and (not os.path.exists(json_path) or os.path.getmtime(path) >= os.path.getmtime(json_path)):
+        return path
+    return None
+
+
+def iter_flat_projects(path):
+    """逐行读取扁平清单，产出 (项目名称, 原内部路径)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                rec = json.loads(line)
+                yield rec["project"], rec["path"]
\ No newline at end of file